@@ -8,111 +8,392 @@
     It uses the given select_unassigned_variable, order_domain_values, and
     inference (constraint propagation) functions to perform the search.
 
+    By default it backtracks chronologically. With backjumping, it does
+    conflict-directed backjumping (CBJ): every variable on the stack has a
+    conflict set of the earlier decisions that caused its values to fail,
+    and when it runs out of values the search jumps straight back to the
+    most recent of them, undoing every decision in between.
+
+    With a NogoodStore (see nogood_store.py), the conflict set of every dead
+    end is also recorded as a nogood, and values that would complete a
+    recorded nogood are rejected without being tried.
+
+    With a restart schedule (see restarts.py), the search gives up its
+    current decisions whenever it has expanded the next number of nodes of
+    the schedule, and starts again with the ties of the variable selection
+    heuristics broken in a new random order. Learned nogoods and the saved
+    phases of the variables (see CSP.phases) are kept across restarts.
+
+    With a SearchStats (see search_stats.py), the time and calls of each
+    phase of the search are recorded, along with backtracks, depth and the
+    size of the trail.
+
+    With SearchLimits (see search_limits.py), the search stops without an
+    answer when it reaches a node, time or memory limit, and the limits keep
+    the reason and the deepest partial assignment reached.
+
+    The search is written as a generator that can go on after a solution, as
+    if its last value had failed, so iter_solutions and count_solutions
+    enumerate all the solutions of a CSP with the same stack, one at a time.
+    Once a solution is found, every decision on the stack blames all the
+    earlier ones for its failures, so backjumping never skips a decision
+    whose other values may lead to more solutions, and restarts stop, since
+    they would find the same solutions again.
+
     You can look in this file if you are curious about how the search algorithm
     works, but it should not be required to complete the assignment.
 
     ********** Do not modify any code in this file **********
 """
 
+import random
 import sys
 import time
 
 
 def search(csp, initial_assignment, select_unassigned_variable,
-           order_domain_values, inference):
+           order_domain_values, inference, backjumping=False, local_inference=False,
+           nogoods=None, restarts=None, stats=None, limits=None):
     """ Do backtracking search on the CSP.
 
         Return the assignment found as a solution, the number of nodes expanded
         and the search time. If no solution can be found, None will be returned
         in place of the solution.
 
+        If backjumping is True, conflict-directed backjumping is used. The
+        culprits of a value rejected by csp.count_conflicts are the decisions
+        that pruned the domains of the neighbours it conflicts with. If
+        local_inference is True, the values pruned by the inference function
+        after a decision only depend on that decision (as with forward
+        checking, or without inference), so these prunings are blamed on that
+        decision alone. Otherwise they are also blamed on every earlier
+        decision. A value rejected by the inference function is blamed on
+        every earlier decision.
+
+        If nogoods is a NogoodStore, backjumping is used and the dead ends
+        are recorded in the store.
+
+        If restarts is an iterator over node cutoffs, the search restarts
+        after expanding each number of nodes in turn.
+
+        If stats is a SearchStats, the statistics of the search are recorded
+        in it.
+
+        If limits is a SearchLimits and one of its limits is reached, the
+        search stops and returns None in place of the solution, with the
+        reason in limits.reason.
+
         (CSP, set([str]), (set([str]), CSP) -> ({str : str}, int, float)
     """
 
+
+    start_time = time.time()
+    solutions = _search(csp, initial_assignment, select_unassigned_variable, order_domain_values,
+                        inference, backjumping, local_inference, nogoods, restarts, stats, limits)
+    try:
+        assignment, n_expanded_nodes, n_restarts = next(solutions)
+        if assignment is not None:
+            assignment = dict(assignment)
+    finally:
+        solutions.close()
+    soln_time = time.time() - start_time
+
+    if assignment is not None:
+        print("Solved problem!")
+    elif limits is not None and limits.reason is not None:
+        print("Search stopped:", limits.reason)
+    else:
+        print("No solution!")
+    print("Nodes expanded:", n_expanded_nodes)
+    if restarts is not None:
+        print("Restarts:", n_restarts)
+    print("Time:", soln_time)
+    return assignment, n_expanded_nodes, soln_time
+
+
+def iter_solutions(csp, initial_assignment, select_unassigned_variable,
+                   order_domain_values, inference, backjumping=False, local_inference=False,
+                   nogoods=None, restarts=None, stats=None, limits=None):
+    """ Yield every solution of the CSP in turn, each one as a new dictionary.
+        The options are those of search(). The search goes on from its stack
+        after each solution, so only the current branch is kept in memory.
+        If a limit is reached, the generator stops early, with the reason in
+        limits.reason.
+
+        (CSP, {str : str}, ...) -> iter({str : str})
+    """
+    solutions = _search(csp, initial_assignment, select_unassigned_variable, order_domain_values,
+                        inference, backjumping, local_inference, nogoods, restarts, stats, limits)
+    try:
+        for assignment, _, _ in solutions:
+            if assignment is None:
+                return
+            yield dict(assignment)
+    finally:
+        solutions.close()
+
+
+def count_solutions(csp, initial_assignment, select_unassigned_variable,
+                    order_domain_values, inference, backjumping=False, local_inference=False,
+                    nogoods=None, restarts=None, stats=None, limits=None,
+                    on_solution=None, max_solutions=None):
+    """ Count the solutions of the CSP. The options are those of search().
+        If on_solution is given, it is called with each solution, which is
+        only valid until it returns. If max_solutions is given, the count
+        stops there.
+
+        Return the number of solutions, the number of nodes expanded and the
+        search time. If a limit is reached, the number of solutions is only
+        the number found so far, and the reason is in limits.reason.
+
+        (CSP, {str : str}, ...) -> (int, int, float)
+    """
     start_time = time.time()
+    n_solutions = 0
+    n_expanded_nodes = 0
+    solutions = _search(csp, initial_assignment, select_unassigned_variable, order_domain_values,
+                        inference, backjumping, local_inference, nogoods, restarts, stats, limits)
+    try:
+        while max_solutions is None or n_solutions < max_solutions:
+            assignment, n_expanded_nodes, _ = next(solutions)
+            if assignment is None:
+                break
+            n_solutions += 1
+            if on_solution is not None:
+                on_solution(assignment)
+    finally:
+        solutions.close()
+    return n_solutions, n_expanded_nodes, time.time() - start_time
+
+
+def _search(csp, initial_assignment, select_unassigned_variable,
+            order_domain_values, inference, backjumping=False, local_inference=False,
+            nogoods=None, restarts=None, stats=None, limits=None):
+    """ Do backtracking search on the CSP, with the options of search(), as
+        a generator. Yield (assignment, number of nodes expanded, number of
+        restarts) for each solution, where assignment is the one of the
+        search, which it changes when it goes on. Then yield them with None
+        in place of the assignment once, when there are no more solutions or
+        a limit is reached. If the generator is closed before that, the
+        decisions it made are undone.
+    """
+    if limits is not None:
+        limits.start()
+    if nogoods is not None:
+        backjumping = True
     assignment = dict(initial_assignment)
 
     # The stack will contain a list of [var, values, val_pos]
     # if values is None then this was not a decision
     stack = []
 
-    n_expanded_nodes = 0
-    while True:
-        # Select the variable to be expanded
-        var = select_unassigned_variable(assignment, csp)
-
-        # Check if all variables are assigned and we therefore have a solution
-        if var is None:
-            print("Solved problem!")
-            print("Nodes expanded:", n_expanded_nodes)
-            soln_time = time.time() - start_time
-            print("Time:", soln_time)
-            return assignment, n_expanded_nodes, soln_time
+    # With backjumping, the conflict set of each entry of the stack: the
+    # indices in the stack of the decisions blamed for its failed values
+    conflict_sets = []
+    base_level = len(csp.trail_levels)
 
-        # Order the values for this variable
-        values = order_domain_values(var, assignment, csp)
+    def culprits(variables):
+        """ Return the indices in the stack of the decisions blamed for the
+            values pruned from the current domains of the given variables.
+        """
+        levels = csp.pruning_levels(variables)
+        if levels and not local_inference:
+            levels = range(max(levels) + 1)
+        return [level - base_level for level in levels if level >= base_level]
 
-        # Push the new variable onto the stack so we can go through its values
-        stack.append([var, values, 0])
+    # With statistics, the functions of each phase are called through
+    # timing wrappers, otherwise directly
+    count_conflicts = csp.count_conflicts
+    make_assignment = csp.make_assignment
+    notify_of_inference = csp.notify_of_inference
+    clear_assignment = csp.clear_assignment
+    check_nogood = None if nogoods is None else nogoods.check
+    if stats is not None:
+        select_unassigned_variable = stats.timed("select", select_unassigned_variable)
+        order_domain_values = stats.timed("order", order_domain_values)
+        count_conflicts = stats.timed("count_conflicts", count_conflicts)
+        make_assignment = stats.timed("assign", make_assignment)
+        inference = stats.timed_inference(inference)
+        notify_of_inference = stats.timed("notify", notify_of_inference)
+        clear_assignment = stats.timed("undo", clear_assignment)
+        if backjumping:
+            culprits = stats.timed("backjumping", culprits)
+        if nogoods is not None:
+            check_nogood = stats.timed("nogoods", check_nogood)
 
-        # Try and assign the values in the given order
+    n_expanded_nodes = 0
+    n_restarts = 0
+    stopped = False
+    next_restart = None if restarts is None else next(restarts)
+    try:
         while True:
-            var, values, pos = stack[-1]
+            # Restart when the node budget of the current run is spent
+            if next_restart is not None and n_expanded_nodes >= next_restart:
+                while stack:
+                    clear_assignment(stack.pop()[0], assignment)
+                conflict_sets = []
+                csp.shuffle_variable_order(random)
+                n_restarts += 1
+                next_restart = n_expanded_nodes + next(restarts)
 
-            if pos >= len(values):
-                # There are no more values, so backtrack
-                stack.pop()
+            # Select the variable to be expanded
+            var = select_unassigned_variable(assignment, csp)
 
-                # We have run out of values for the very first variable, so UNSAT!
-                if not stack:
-                    print("No solution!")
-                    print("Nodes expanded:", n_expanded_nodes)
-                    soln_time = time.time() - start_time
-                    print("Time:", soln_time)
-                    return None, n_expanded_nodes, soln_time
+            # Check if all variables are assigned and we therefore have a solution
+            if var is None:
+                if stats is not None:
+                    stats.on_decision(len(stack), len(csp.trail))
+                yield assignment, n_expanded_nodes, n_restarts
 
-                # We are making the next decision at the backtracked level
+                # Go on with the next value of the latest decision. Every decision
+                # on the stack has a solution below it, so it now blames all the
+                # earlier ones: their other values may lead to other solutions.
+                if not stack:
+                    yield None, n_expanded_nodes, n_restarts
+                    return
+                next_restart = None
+                for i, conflict_set in enumerate(conflict_sets):
+                    conflict_set.update(range(i))
                 stack[-1][2] += 1
+                clear_assignment(stack[-1][0], assignment)
 
-                # The method csp.clear_assignment() restores the domain of
-                # `undo_var` to the domain before the assignment. It will also
-                # delete `undo_var` from the dictionary `assignment.`
-                undo_var = stack[-1][0]
-                csp.clear_assignment(undo_var, assignment)
-                continue
+            else:
+                # Order the values for this variable
+                values = order_domain_values(var, assignment, csp)
 
-            n_expanded_nodes += 1
+                # Push the new variable onto the stack so we can go through its values
+                stack.append([var, values, 0])
+                if backjumping:
+                    conflict_sets.append(set())
+                if stats is not None:
+                    stats.on_decision(len(stack), len(csp.trail))
 
-            val = values[pos]
+            # Try and assign the values in the given order
+            while True:
+                var, values, pos = stack[-1]
 
-            # Check if setting this value would cause a direct conflict. This
-            # involves looping through all the immediate neighbours of vars. If
-            # there exists at least one neighbour with an empty domain after we
-            # assign val to var, then we skip this iteration.
-            if csp.count_conflicts(var, val):
-                stack[-1][2] += 1
-                continue
+                if pos >= len(values):
+                    # There are no more values, so backtrack
+                    stack.pop()
+                    if stats is not None:
+                        stats.backtracks += 1
 
-            # We do not immediately conflict, so make the assignment. The
-            # method csp.make_assignment() simply reduces the domain of var
-            # into a singleton.
-            csp.make_assignment(var, val)
-            assignment[var] = val
+                    # With backjumping, undo every decision more recent than the
+                    # latest culprit, which inherits the other culprits. If there
+                    # is no culprit, no decision can be undone to fix the failure.
+                    # The decisions that pruned the domain of var are culprits
+                    # too, since the values they removed were never tried.
+                    if backjumping:
+                        conflict_set = conflict_sets.pop()
+                        conflict_set.update(culprits(set([var])))
+                        if not conflict_set:
+                            while stack:
+                                clear_assignment(stack.pop()[0], assignment)
+                        else:
+                            if nogoods is not None:
+                                nogoods.add([(stack[i][0], assignment[stack[i][0]])
+                                             for i in sorted(conflict_set)], assignment)
+                            target = max(conflict_set)
+                            conflict_set.discard(target)
+                            while len(stack) > target + 1:
+                                clear_assignment(stack.pop()[0], assignment)
+                                conflict_sets.pop()
+                            conflict_sets[target].update(conflict_set)
 
-            # Use the inference function to do constraint propagation, which will
-            # possibly make more assignments or detect a conflict
-            pruned_list = inference(var, assignment, csp)
+                    # We have run out of values for the very first variable, so
+                    # there is no (other) solution
+                    if not stack:
+                        yield None, n_expanded_nodes, n_restarts
+                        return
 
-            # If there is a conflict, undo the last assignment and get ready to
-            # try the next one
-            if pruned_list is None:
-                stack[-1][2] += 1
-                csp.clear_assignment(var, assignment)
-                continue
+                    # We are making the next decision at the backtracked level
+                    stack[-1][2] += 1
 
-            # Update the CSP with the results of the inference procedure
-            csp.notify_of_inference(var, assignment, pruned_list)
+                    # The method csp.clear_assignment() restores the domain of
+                    # `undo_var` to the domain before the assignment. It will also
+                    # delete `undo_var` from the dictionary `assignment.`
+                    undo_var = stack[-1][0]
+                    clear_assignment(undo_var, assignment)
+                    continue
 
-            # Given our best knowledge, there is no conflict yet, so we go back
-            # up to the outer loop and continue to choose a new variable
-            break
+                # Stop if a limit is reached. The next check is a node count, so
+                # the clock and the memory are rarely read.
+                if limits is not None and n_expanded_nodes >= limits.next_check \
+                        and limits.exceeded(n_expanded_nodes):
+                    stopped = True
+                    break
+
+                n_expanded_nodes += 1
+
+                val = values[pos]
+
+                # Check if setting this value would cause a direct conflict. This
+                # involves looping through all the immediate neighbours of vars. If
+                # there exists at least one neighbour with an empty domain after we
+                # assign val to var, then we skip this iteration.
+                # The constraints that fail have their weight increased, for the
+                # dom/wdeg heuristic.
+                if count_conflicts(var, val):
+                    violated = csp.get_violated_constraints(var, val)
+                    for var0, var1 in violated:
+                        csp.increase_conflict_weight(var0, var1)
+                    if backjumping:
+                        conflict_sets[-1].update(culprits(set([var1 for _, var1 in violated])))
+                    stack[-1][2] += 1
+                    continue
+
+                # Skip the value if it completes a recorded nogood, and blame the
+                # decisions of the nogood
+                if nogoods is not None:
+                    nogood = check_nogood(var, val, assignment)
+                    if nogood is not None:
+                        depth = dict([(entry[0], i) for i, entry in enumerate(stack)])
+                        conflict_sets[-1].update([depth[ovar] for ovar, _ in nogood if ovar != var])
+                        stack[-1][2] += 1
+                        continue
+
+                # We do not immediately conflict, so make the assignment. The
+                # method csp.make_assignment() simply reduces the domain of var
+                # into a singleton.
+                make_assignment(var, val)
+                assignment[var] = val
+
+                # Use the inference function to do constraint propagation, which will
+                # possibly make more assignments or detect a conflict
+                pruned_list = inference(var, assignment, csp)
+
+                # If there is a conflict, undo the last assignment and get ready to
+                # try the next one. The inference function has already increased
+                # the weight of the constraint which wiped out a domain.
+                if pruned_list is None:
+                    if backjumping:
+                        conflict_sets[-1].update(range(len(stack) - 1))
+                    stack[-1][2] += 1
+                    clear_assignment(var, assignment)
+                    continue
+
+                # Update the CSP with the results of the inference procedure
+                notify_of_inference(var, assignment, pruned_list)
+                if nogoods is not None:
+                    nogoods.on_assign(var, val, assignment)
+                if limits is not None:
+                    limits.record(assignment)
+
+                # Given our best knowledge, there is no conflict yet, so we go back
+                # up to the outer loop and continue to choose a new variable
+                break
+
+            # A limit was reached while trying the values of the latest
+            # variable: undo the decisions before it and give up
+            if stopped:
+                stack.pop()
+                while stack:
+                    clear_assignment(stack.pop()[0], assignment)
+                yield None, n_expanded_nodes, n_restarts
+                return
+    finally:
+        # If the generator is closed early, for instance after the first
+        # solution, undo the decisions still on the trail so that the CSP
+        # can be searched again
+        while len(csp.trail_levels) > base_level:
+            csp.clear_assignment(csp.trail_levels[-1][0], assignment)
@@ -0,0 +1,95 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" Benchmark of CSP.count_conflicts against the support masks of BitsetCSP.
+
+    For every given problem, both cores parse the file and run AC-3
+    preprocessing so the domains look like the ones seen during search. Then
+    count_conflicts is called on every (variable, value) pair of the original
+    domains, the given number of times, and the best time of each core is
+    reported together with the speedup.
+
+    Usage:
+        python benchmark_conflicts.py [-r REPEAT] [CSP_FILE ...]
+
+    Without files, the Sudoku problems test_problems/sudoku_01..10 are used.
+"""
+
+import argparse
+import time
+
+import bitset_csp
+import inference
+from csp import CSP
+
+
+def parse_cmd_line_args() -> argparse.Namespace:
+    """ Parse the command line arguments and return an object with attributes
+        containing the parsed arguments or their default values.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_names", metavar="INPUT", nargs="*",
+                        default=["test_problems/sudoku_%02d.csp" % i for i in range(1, 11)],
+                        help="The CSP files to benchmark (default: the Sudoku suite).")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=20,
+                        metavar="REPEAT", help="Number of passes over all the pairs (default: %(default)s)")
+    return parser.parse_args()
+
+
+def load(csp, file_name, arc_consistency):
+    """ Parse the file into the given CSP and apply AC-3 preprocessing.
+        (CSP, str, function) -> CSP
+    """
+    if not csp.parse_csp_file(file_name):
+        raise SystemExit("Error: could not parse " + file_name)
+    pruned_list = arc_consistency(None, {}, csp)
+    if pruned_list is not None:
+        csp.notify_of_inference(None, {}, pruned_list)
+    return csp
+
+
+def time_count_conflicts(csp, repeat):
+    """ Return the best time of a pass of count_conflicts over all the
+        (variable, value) pairs, and the total number of conflicts found.
+        (CSP, int) -> (float, int)
+    """
+    pairs = [(var, val) for var in csp.variables for val in csp.domains[var]]
+    count_conflicts = csp.count_conflicts
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0
+        for var, val in pairs:
+            total += count_conflicts(var, val)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, total
+
+
+def main():
+    """ Run the benchmark on every given file and print a table of results.
+        () -> None
+    """
+    args = parse_cmd_line_args()
+    print("%-32s %12s %12s %9s" % ("problem", "set (ms)", "bitset (ms)", "speedup"))
+    total_set = total_bitset = 0.0
+    for file_name in args.input_file_names:
+        set_csp = load(CSP(), file_name, inference.arc_consistency)
+        bit_csp = load(bitset_csp.BitsetCSP(), file_name, bitset_csp.arc_consistency)
+        set_time, set_total = time_count_conflicts(set_csp, args.repeat)
+        bit_time, bit_total = time_count_conflicts(bit_csp, args.repeat)
+        if set_total != bit_total:
+            raise SystemExit("Error: the two cores disagree on " + file_name)
+        total_set += set_time
+        total_bitset += bit_time
+        print("%-32s %12.3f %12.3f %8.1fx" % (file_name, set_time * 1000,
+                                             bit_time * 1000, set_time / bit_time))
+    print("%-32s %12.3f %12.3f %8.1fx" % ("total", total_set * 1000,
+                                         total_bitset * 1000, total_set / total_bitset))
+
+
+if __name__ == "__main__":
+    main()
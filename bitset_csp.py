@@ -0,0 +1,437 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file contains a class BitsetCSP, a compact alternative to the CSP
+    class in csp.py.
+
+    Variables and values are interned to integers. The current domain of each
+    variable is a single int used as a bitmask (bit i is set when the i-th
+    value of the variable's original domain is still available), and the
+    constraints are stored as support masks: for each (variable, value) pair
+    and each neighbour, the bitmask of the neighbour's values that are
+    compatible with it. Checking whether a neighbour still has a support is
+    then a single AND with its current domain.
+
+    The string API of CSP is kept as a thin facade: `current_domains` and
+    `conflicts` can still be read with variable and value names, so the
+    heuristics and inference functions written against CSP keep working.
+    Code that wants the speed of the compact core should use the `*_masks`
+    attributes and the native inference functions at the bottom of this file.
+
+    Select this core in the solver with `-c bitset`.
+"""
+
+from typing import Callable, Dict, List, Set
+
+from csp import CSP, Value, Variable, VarPair
+import inference
+
+
+def iter_bits(mask):
+    """ Yield the positions of the bits set in the given mask, lowest first.
+        (int) -> iter(int)
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _DomainView:
+    """ A read/write view of the current domains of a BitsetCSP that maps
+        variable names to sets of value names.
+    """
+
+    def __init__(self, csp):
+        self._csp = csp
+
+    def __getitem__(self, var):
+        csp = self._csp
+        vid = csp.var_ids[var]
+        values = csp.value_names[vid]
+        return set([values[i] for i in iter_bits(csp.domain_masks[vid])])
+
+    def __setitem__(self, var, values):
+        csp = self._csp
+        vid = csp.var_ids[var]
+        csp.domain_masks[vid] = csp.mask_of(var, values)
+
+    def __contains__(self, var):
+        return var in self._csp.var_ids
+
+    def __iter__(self):
+        return iter(self._csp.variables)
+
+    def __len__(self):
+        return len(self._csp.variables)
+
+    def keys(self):
+        return list(self._csp.variables)
+
+    def values(self):
+        return [self[var] for var in self._csp.variables]
+
+    def items(self):
+        return [(var, self[var]) for var in self._csp.variables]
+
+
+class _ConflictView:
+    """ A read-only view of the conflict graph of a BitsetCSP that maps
+        (variable, value) pairs to dictionaries {neighbour : set of values}.
+    """
+
+    def __init__(self, csp):
+        self._csp = csp
+
+    def __getitem__(self, pair):
+        csp = self._csp
+        var, val = pair
+        vid = csp.var_ids[var]
+        row = csp.support_masks[vid][csp.value_ids[vid][val]]
+        result = {}
+        for oid, support in row.items():
+            ovalues = csp.value_names[oid]
+            conflict = csp.mask_of(csp.variables[oid], csp.domains[csp.variables[oid]]) & ~support
+            result[csp.variables[oid]] = set([ovalues[i] for i in iter_bits(conflict)])
+        return result
+
+    def __contains__(self, pair):
+        var, val = pair
+        vid = self._csp.var_ids.get(var)
+        return vid is not None and val in self._csp.value_ids[vid]
+
+    def __len__(self):
+        return sum([len(values) for values in self._csp.value_names])
+
+    def __iter__(self):
+        csp = self._csp
+        for vid, values in enumerate(csp.value_names):
+            for val in values:
+                yield (csp.variables[vid], val)
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        return [(pair, self[pair]) for pair in self]
+
+
+class BitsetCSP(CSP):
+    """ A CSP whose domains and conflicts are stored as integer bitmasks.
+        It can be used anywhere a CSP is expected.
+    """
+
+    def __init__(self, native_alldiff=False):
+        """Make a new BitsetCSP with no variables."""
+        super().__init__(native_alldiff)
+
+        # The trail inherited from CSP holds (vid, removed bits) entries
+        # instead of (var, value) pairs, but is split into trail_levels in the
+        # same way
+
+        # Each variable is interned to its position in self.variables
+        self.var_ids: Dict[Variable, int] = {}
+
+        # value_names[vid][i] is the value represented by bit i of the domain
+        # masks of variable vid, and value_ids[vid] is the inverse mapping
+        self.value_names: List[List[Value]] = []
+        self.value_ids: List[Dict[Value, int]] = []
+
+        # The current domain of each variable as a bitmask
+        self.domain_masks: List[int] = []
+
+        # support_masks[vid][i] maps each neighbour oid of vid to the bitmask
+        # of the values of oid that are compatible with setting vid to value i
+        self.support_masks: List[List[Dict[int, int]]] = []
+
+        # The string facade over the masks above
+        self.current_domains = _DomainView(self)
+        self.conflicts = _ConflictView(self)
+
+        # The scopes of the constraints, in the order they were added. The
+        # allowed pairs are not kept, see ground_conflicts below
+        self.constraint_scopes: List[VarPair] = []
+
+    @property
+    def ground_conflicts(self):
+        """ The ground constraints as (var0, var1, allowed pairs), rebuilt from
+            the support masks instead of being stored.
+        """
+        return [(var0, var1, self.allowed_pairs(var0, var1))
+                for var0, var1 in self.constraint_scopes]
+
+    @ground_conflicts.setter
+    def ground_conflicts(self, constraints):
+        self.constraint_scopes = [(var0, var1) for var0, var1, _ in constraints]
+
+    def allowed_pairs(self, var0, var1):
+        """ Return the pairs of values allowed by the constraint between var0
+            and var1.
+            (BitsetCSP, str, str) -> [(str, str)]
+        """
+        vid0, vid1 = self.var_ids[var0], self.var_ids[var1]
+        names1 = self.value_names[vid1]
+        allowed = []
+        for i, row in enumerate(self.support_masks[vid0]):
+            if vid1 in row:
+                val0 = self.value_names[vid0][i]
+                allowed.extend([(val0, names1[j]) for j in iter_bits(row[vid1])])
+        return allowed
+
+    def mask_of(self, var, values):
+        """ Return the bitmask representing the given values of var.
+            (BitsetCSP, str, [str]) -> int
+        """
+        ids = self.value_ids[self.var_ids[var]]
+        mask = 0
+        for val in values:
+            mask |= 1 << ids[val]
+        return mask
+
+    def count_conflicts(self, var: Variable, val: Value) -> int:
+        """Count the constraints that would be violated by making this assignment."""
+        vid = self.var_ids[var]
+        masks = self.domain_masks
+        n_conflicts = 0
+        for oid, support in self.support_masks[vid][self.value_ids[vid][val]].items():
+            if not masks[oid] & support:
+                n_conflicts += 1
+        if var in self.alldiffs_of:
+            n_conflicts += len(self.alldiff_conflicts(var, val))
+        return n_conflicts
+
+    def get_violated_constraints(self, var: Variable, val: Value) -> Set[VarPair]:
+        """Return the scopes of the constraints that would be violated by making this assignment."""
+        vid = self.var_ids[var]
+        masks = self.domain_masks
+        violated = set()
+        for oid, support in self.support_masks[vid][self.value_ids[vid][val]].items():
+            if not masks[oid] & support:
+                violated.add((var, self.variables[oid]))
+        if var in self.alldiffs_of:
+            violated.update([(var, ovar) for ovar in self.alldiff_conflicts(var, val)])
+        return violated
+
+    def alldiff_conflicts(self, var: Variable, val: Value) -> List[Variable]:
+        """ Return the variables sharing a native alldiff constraint with var
+            whose current domain is exactly {val}.
+        """
+        culprits = []
+        for index in self.alldiffs_of[var]:
+            for ovar in self.alldiffs[index]:
+                if ovar != var:
+                    oid = self.var_ids[ovar]
+                    bit = self.value_ids[oid].get(val)
+                    if bit is not None and self.domain_masks[oid] == 1 << bit:
+                        culprits.append(ovar)
+        return culprits
+
+    def notify_of_inference(self, var, assignment, pruned_list):
+        """ Notify the problem that setting the given variable caused the given
+            list of (var, value) pairs to be pruned from domains.
+            (BitsetCSP, str, {str : str}, [(str, str)]) -> None
+        """
+        masks = self.domain_masks
+        trail = self.trail
+        for ovar, oval in pruned_list:
+            oid = self.var_ids[ovar]
+            bit = 1 << self.value_ids[oid][oval]
+            if not masks[oid] & bit:
+                raise ValueError("Error: " + oval +
+                                 " not in the current domain of " + ovar)
+            masks[oid] ^= bit
+            if var is not None:
+                trail.append((oid, bit))
+        if self.watchers and pruned_list:
+            changed = set([ovar for ovar, _ in pruned_list])
+            for watcher in self.watchers:
+                watcher.on_domains_changed(changed)
+
+    def make_assignment(self, var, val):
+        """ Assign the given variable to the given value and save the information
+            so that we can undo the decision.
+            (BitsetCSP, str, str) -> None
+        """
+        vid = self.var_ids[var]
+        bit = 1 << self.value_ids[vid][val]
+        self.trail_levels.append((var, len(self.trail)))
+        self.trail.append((vid, self.domain_masks[vid] & ~bit))
+        self.domain_masks[vid] = bit
+        self.phases[var] = val
+        for watcher in self.watchers:
+            watcher.on_assign(var)
+
+    def clear_assignment(self, var, assignment=None):
+        """ Undo the assignment on the given variable and undo and changes to the
+            domains of other variables that resulted.
+            (BitsetCSP, str) -> None
+        """
+        level_var, start = self.trail_levels[-1]
+        if level_var != var:
+            raise ValueError("Error: cannot undo " + str(var) +
+                             " before the more recent decision on " + str(level_var))
+        self.trail_levels.pop()
+        masks = self.domain_masks
+        trail = self.trail
+        if self.watchers:
+            changed = set([self.variables[oid] for oid, _ in trail[start:]])
+        for oid, removed in trail[start:]:
+            masks[oid] |= removed
+        del trail[start:]
+        if assignment is not None:
+            del assignment[var]
+        for watcher in self.watchers:
+            watcher.on_unassign(var)
+            watcher.on_domains_changed(changed)
+
+    def pruning_levels(self, variables):
+        """ Return the indices in trail_levels of the decisions whose level
+            removed values from the current domains of the given variables.
+            The entries of the trail start with a variable id instead of a
+            name, so the names are translated before scanning it.
+            (BitsetCSP, set([str])) -> set([int])
+        """
+        return CSP.pruning_levels(self, set([self.var_ids[var] for var in variables]))
+
+    def domain_size(self, var: Variable) -> int:
+        """Return the size of the current domain of var."""
+        return bin(self.domain_masks[self.var_ids[var]]).count("1")
+
+    def add_variables(self, variables, domain):
+        """ Add the given variables to the CSP, which all have the given domain.
+            (BitsetCSP, [object], [object]) -> None
+        """
+        for var in variables:
+            if var in self.var_ids:
+                raise ValueError("Variable already exists: ", str(var))
+            if not domain:
+                raise ValueError("Empty domain")
+            vid = len(self.variables)
+            self.variables.append(var)
+            self.var_ids[var] = vid
+            self.domains[var] = list(domain)
+            self.value_names.append(list(domain))
+            self.value_ids.append(dict([(val, i) for i, val in enumerate(domain)]))
+            self.domain_masks.append((1 << len(domain)) - 1)
+            self.support_masks.append([{} for _ in domain])
+            self.neighbours[var] = set()
+
+    def add_constraint(self, var0, var1, value_list):
+        """ Add the given constraint to the CSP. As in CSP.add_constraint, the
+            value_list is a set of positive pairs, and the supports of this
+            constraint replace any previous ones between var0 and var1.
+            (BitsetCSP, str, str, [(str, str)]) -> None
+        """
+        if var0 not in self.domains:
+            raise ValueError("Unknown variable: " + str(var0))
+        if var1 not in self.domains:
+            raise ValueError("Unknown variable: " + str(var1))
+
+        self.constraint_scopes.append((var0, var1))
+        self.conflict_weights[(var0, var1)] = 1
+        self.conflict_weights[(var1, var0)] = 1
+
+        allowed_values = set([tuple(x) for x in value_list])
+
+        vid0, vid1 = self.var_ids[var0], self.var_ids[var1]
+        row0, row1 = self.support_masks[vid0], self.support_masks[vid1]
+        ids0, ids1 = self.value_ids[vid0], self.value_ids[vid1]
+        for var0_val in self.domains[var0]:
+            row0[ids0[var0_val]][vid1] = 0
+        for var1_val in self.domains[var1]:
+            row1[ids1[var1_val]][vid0] = 0
+        for var0_val in self.domains[var0]:
+            i0 = ids0[var0_val]
+            for var1_val in self.domains[var1]:
+                if (var0_val, var1_val) in allowed_values:
+                    i1 = ids1[var1_val]
+                    row0[i0][vid1] |= 1 << i1
+                    row1[i1][vid0] |= 1 << i0
+        self.neighbours[var0].add(var1)
+        self.neighbours[var1].add(var0)
+
+
+# -------------------------------------------------------------------------------
+# Inference functions working directly on the bitmasks of a BitsetCSP. They
+# have the same interface and results as the ones in inference.py.
+# -------------------------------------------------------------------------------
+
+def forward_checking(var, assignment, gamma):
+    """ Forward checking on a BitsetCSP.
+        (str, {str : str}, BitsetCSP) -> [(str, str)] or None
+    """
+    vid = gamma.var_ids[var]
+    masks = gamma.domain_masks
+    pruned_list = []
+    for oid, support in gamma.support_masks[vid][gamma.value_ids[vid][assignment[var]]].items():
+        removed = masks[oid] & ~support
+        if removed:
+            ovar = gamma.variables[oid]
+            if removed == masks[oid]:
+                gamma.increase_conflict_weight(var, ovar)
+                return None
+            ovalues = gamma.value_names[oid]
+            pruned_list.extend([(ovar, ovalues[i]) for i in iter_bits(removed)])
+    return pruned_list
+
+
+def arc_consistency(var, assignment, gamma):
+    """ AC-3 on a BitsetCSP. The domains changed by the propagation are kept in
+        a small overlay, so the CSP is left untouched.
+        (str or None, {str : str}, BitsetCSP) -> [(str, str)] or None
+    """
+    masks = gamma.domain_masks
+    support_masks = gamma.support_masks
+    neighbour_ids = [[gamma.var_ids[o] for o in gamma.neighbours[v]]
+                     for v in gamma.variables] if var is None else None
+    local = {}
+
+    def neighbours_of(vid):
+        if neighbour_ids is not None:
+            return neighbour_ids[vid]
+        return [gamma.var_ids[o] for o in gamma.neighbours[gamma.variables[vid]]]
+
+    if var is None:
+        queue = set([(i, j) for i in range(len(gamma.variables)) for j in neighbour_ids[i]])
+    else:
+        vid = gamma.var_ids[var]
+        queue = set([(i, vid) for i in neighbours_of(vid)])
+
+    while queue:
+        i, j = queue.pop()
+        dom_i = local.get(i, masks[i])
+        dom_j = local.get(j, masks[j])
+        rows = support_masks[i]
+        revised = dom_i
+        for bit in iter_bits(dom_i):
+            if not dom_j & rows[bit][j]:
+                revised ^= 1 << bit
+        if revised != dom_i:
+            if not revised:
+                gamma.increase_conflict_weight(gamma.variables[i], gamma.variables[j])
+                return None
+            local[i] = revised
+            for k in neighbours_of(i):
+                if k != j:
+                    queue.add((k, i))
+
+    pruned_list = []
+    for vid, mask in local.items():
+        ovar = gamma.variables[vid]
+        ovalues = gamma.value_names[vid]
+        pruned_list.extend([(ovar, ovalues[i]) for i in iter_bits(masks[vid] & ~mask)])
+    return pruned_list
+
+
+def get_inference_function(inference_type: str) -> Callable:
+    """ Return the inference function to use with a BitsetCSP. The native
+        versions are used where they exist, otherwise the string-based ones
+        from inference.py work through the facade.
+    """
+    if inference_type == "forward":
+        return forward_checking
+    if inference_type == "arc":
+        return arc_consistency
+    return inference.get_inference_function(inference_type)
@@ -22,9 +22,10 @@
     ********** Do not modify any code in this file **********
 """
 
+import bisect
 import itertools
 import os
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 Variable = str
 Value = str
@@ -37,8 +38,13 @@ class CSP:
         and constraints to.
     """
 
-    def __init__(self):
-        """Make a new CSP with no variables."""
+    def __init__(self, native_alldiff=False):
+        """ Make a new CSP with no variables.
+
+            If native_alldiff is True, alldiff constraints are kept as global
+            constraints in `alldiffs` instead of being decomposed into binary
+            inequalities.
+        """
         # Here variables are strings
         self.variables: List[Variable] = []
 
@@ -54,7 +60,11 @@ class CSP:
         # key X. The value of the dictionary is another dictionary, which maps
         # other variables to the values that conflict with X.
         self.conflicts: Dict[Pair, Dict[Variable, Set[Value]]] = {}
-        self.conflict_weights = {}
+
+        # The weight of each constraint, keyed by both (var0, var1) and
+        # (var1, var0). It starts at 1 and is increased every time the
+        # constraint causes a failure during search, for the dom/wdeg heuristic.
+        self.conflict_weights: Dict[VarPair, int] = {}
 
         # A list of ground conflicts in case we want to display them
         self.ground_conflicts: List[str] = []
@@ -64,12 +74,41 @@ class CSP:
         self.current_domains: Dict[Variable, Set[Value]] = {}
 
         # Whenever changes to domains we need to backtrack. You do not need to use it directly.
-        self.undo_domains: Dict[Variable, Set[Pair]] = {}
-        self.undo_domains[None] = set()
-
-        # Whenever changes to assignments we need to backtrack. You do not need to use it directly.
-        self.undo_assignments: Dict[Variable, Set[Variable]] = {}
-        self.undo_assignments[None] = set()
+        # The trail is a single flat list of the (var, value) pairs removed from
+        # the current domains, in order. Each decision opens a level, recorded
+        # in trail_levels as (decision variable, length of the trail when the
+        # level started), and undoing the decision pops the trail back to it.
+        self.trail: List[Pair] = []
+        self.trail_levels: List[Tuple[Variable, int]] = []
+
+        # Objects kept informed of the changes made during search, such as the
+        # incremental variable selection structures in heuristics.py. Each one
+        # has the methods on_assign(var), on_unassign(var) and
+        # on_domains_changed(variables).
+        self.watchers: List[object] = []
+
+        # If not None, the order in which the variable selection heuristics
+        # consider the variables, and so break their ties, instead of the
+        # order of `variables`. Restarts shuffle it (see variable_order).
+        self.tie_break_order: Optional[List[Variable]] = None
+
+        # The last value assigned to each variable, for phase saving
+        self.phases: Dict[Variable, Value] = {}
+
+        # Residual supports used by AC-3rm: the last value of X_j found to
+        # support (X_i, value). They are only hints that are checked against
+        # the current domains before use, so they stay valid when
+        # clear_assignment() backtracks and never need to be restored.
+        self.residues: Dict[Tuple[Variable, Value, Variable], Value] = {}
+
+        # The scopes of the alldiff constraints kept as global constraints, and
+        # for each variable the indices in `alldiffs` of those it appears in.
+        # These are only used when native_alldiff is True. Their scopes are
+        # not added to `neighbours` or `conflicts`, which only describe the
+        # binary constraints.
+        self.native_alldiff = native_alldiff
+        self.alldiffs: List[List[Variable]] = []
+        self.alldiffs_of: Dict[Variable, List[int]] = {}
 
     def count_conflicts(self, var: Variable, val: Value) -> int:
         """Count the constraints that would be violated by making this assignment."""
@@ -87,6 +126,8 @@ class CSP:
                     break
             if not any_valid:
                 n_conflicts += 1
+        if var in self.alldiffs_of:
+            n_conflicts += len(self.alldiff_conflicts(var, val))
         return n_conflicts
 
     def get_violated_constraints(self, var: Variable, val: Value) -> Set[VarPair]:
@@ -100,8 +141,24 @@ class CSP:
                     break
             if not any_valid:
                 violated.add((var, ovar))
+        if var in self.alldiffs_of:
+            violated.update([(var, ovar) for ovar in self.alldiff_conflicts(var, val)])
         return violated
 
+    def alldiff_conflicts(self, var: Variable, val: Value) -> List[Variable]:
+        """ Return the variables sharing a native alldiff constraint with var
+            whose current domain is exactly {val}, i.e. the alldiff
+            constraints that setting var to val would violate.
+        """
+        culprits = []
+        for index in self.alldiffs_of[var]:
+            for ovar in self.alldiffs[index]:
+                if ovar != var:
+                    odomain = self.current_domains[ovar]
+                    if len(odomain) == 1 and val in odomain:
+                        culprits.append(ovar)
+        return culprits
+
 # -------------------------------------------------------------------------------
 # You should not need to look below this point unless you are interested
 # -------------------------------------------------------------------------------
@@ -114,39 +171,174 @@ class CSP:
             This shrinks the current domains and saves the information so we can
             undo our decisions later.
 
-            This method also takes a list of additional assignments made by var,
-            so we can undo these later.
+            The pruned values are pushed on the trail, at the level of var. If
+            var is None (preprocessing), the pruning is permanent.
 
             (CSP, str, {str : str}, [(str, str)]) -> None
         """
+        current_domains = self.current_domains
         for ovar, oval in pruned_list:
-            if oval not in self.current_domains[ovar]:
+            if oval not in current_domains[ovar]:
                 raise ValueError("Error: " + oval +
                                  " not in the current domain of " + ovar)
-            self.current_domains[ovar].remove(oval)
-            self.undo_domains[var].add((ovar, oval))
+            current_domains[ovar].remove(oval)
+        if var is not None:
+            self.trail.extend(pruned_list)
+        if self.watchers and pruned_list:
+            changed = set([ovar for ovar, _ in pruned_list])
+            for watcher in self.watchers:
+                watcher.on_domains_changed(changed)
 
     def make_assignment(self, var, val):
         """ Assign the given variable to the given value and save the information
             so that we can undo the decision.
             (CSP, str, str) -> None
         """
-        self.undo_domains[var] = set([(var, oval)
-                                      for oval in self.current_domains[var] if oval != val])
-        self.undo_assignments[var] = set([var])
-        self.current_domains[var] = set([val])
+        domain = self.current_domains[var]
+        self.trail_levels.append((var, len(self.trail)))
+        self.trail.extend([(var, oval) for oval in domain if oval != val])
+        domain.clear()
+        domain.add(val)
+        self.phases[var] = val
+        for watcher in self.watchers:
+            watcher.on_assign(var)
 
     def clear_assignment(self, var, assignment=None):
         """ Undo the assignment on the given variable and undo and changes to the
-            domains of other variables that resulted.
+            domains of other variables that resulted. Decisions are undone in
+            the reverse order they were made, so var must be the most recent
+            decision that has not been undone.
             (CSP, str) -> None
         """
-        for ovar, oval in self.undo_domains[var]:
-            self.current_domains[ovar].add(oval)
+        level_var, start = self.trail_levels[-1]
+        if level_var != var:
+            raise ValueError("Error: cannot undo " + str(var) +
+                             " before the more recent decision on " + str(level_var))
+        self.trail_levels.pop()
+        current_domains = self.current_domains
+        trail = self.trail
+        if self.watchers:
+            changed = set([ovar for ovar, _ in trail[start:]])
+        for ovar, oval in trail[start:]:
+            current_domains[ovar].add(oval)
+        del trail[start:]
         if assignment is not None:
-            for ovar in self.undo_assignments[var]:
-                del assignment[ovar]
-        del self.undo_assignments[var]
+            del assignment[var]
+        for watcher in self.watchers:
+            watcher.on_unassign(var)
+            watcher.on_domains_changed(changed)
+
+    def domain_size(self, var: Variable) -> int:
+        """Return the size of the current domain of var."""
+        return len(self.current_domains[var])
+
+    def variable_order(self) -> List[Variable]:
+        """Return the variables in the order used to break ties between them."""
+        return self.tie_break_order or self.variables
+
+    def shuffle_variable_order(self, rng):
+        """ Break the ties of the variable selection heuristics in a new random
+            order. The watchers are detached, since they may depend on the
+            order, and the heuristics attach new ones built from the current
+            assignment when they need them.
+            (CSP, random.Random) -> None
+        """
+        self.tie_break_order = list(self.variables)
+        rng.shuffle(self.tie_break_order)
+        self.watchers = []
+
+    def increase_conflict_weight(self, var0, var1):
+        """ Increase the weight of the constraint between var0 and var1, which
+            has just caused a failure. Native alldiff constraints are weighted
+            pairwise, like their binary decomposition.
+            (CSP, str, str) -> None
+        """
+        weight = self.conflict_weights.get((var0, var1), 1) + 1
+        self.conflict_weights[(var0, var1)] = weight
+        self.conflict_weights[(var1, var0)] = weight
+
+    def weighted_degree(self, var, assignment):
+        """ Return the sum of the weights of the constraints between var and
+            the unassigned variables, i.e. the wdeg of var.
+            (CSP, str, {str : str}) -> int
+        """
+        others = set(self.neighbours[var])
+        for index in self.alldiffs_of.get(var, []):
+            others.update(self.alldiffs[index])
+        others.discard(var)
+        weights = self.conflict_weights
+        return sum([weights.get((var, x), 1) for x in others if x not in assignment])
+
+    def pruning_levels(self, variables):
+        """ Return the indices in trail_levels of the decisions whose level
+            removed values from the current domains of the given variables.
+            Values pruned during preprocessing are not on the trail, so they
+            are not blamed on any decision.
+            (CSP, set([str])) -> set([int])
+        """
+        starts = [start for _, start in self.trail_levels]
+        levels = set()
+        for index, (ovar, _) in enumerate(self.trail):
+            if ovar in variables:
+                levels.add(bisect.bisect_right(starts, index) - 1)
+        return levels
+
+    def connected_components(self):
+        """ Return the connected components of the constraint graph, the
+            scopes of the native alldiff constraints included, as lists of
+            variables in the order of `variables`.
+            (CSP) -> [[str]]
+        """
+        component_of = {}
+        components = []
+        for var in self.variables:
+            if var in component_of:
+                continue
+            index = len(components)
+            component_of[var] = index
+            members = []
+            frontier = [var]
+            while frontier:
+                cvar = frontier.pop()
+                members.append(cvar)
+                others = list(self.neighbours[cvar])
+                for alldiff in self.alldiffs_of.get(cvar, []):
+                    others.extend(self.alldiffs[alldiff])
+                for ovar in others:
+                    if ovar not in component_of:
+                        component_of[ovar] = index
+                        frontier.append(ovar)
+            components.append(members)
+        position = dict([(var, i) for i, var in enumerate(self.variables)])
+        return [sorted(members, key=position.get) for members in components]
+
+    def subproblems(self, components):
+        """ Return a new CSP of the same class for each of the given sets of
+            variables, which must be unions of connected components. Each
+            one is built again from the variables, constraints and alldiff
+            constraints of this CSP, and its current domains are the current
+            domains of this CSP, so the values pruned by preprocessing stay
+            pruned.
+            (CSP, [[str]]) -> [CSP]
+        """
+        component_of = {}
+        subs = []
+        for index, variables in enumerate(components):
+            sub = type(self)(self.native_alldiff)
+            for var in variables:
+                component_of[var] = index
+                sub.add_variables([var], self.domains[var])
+            subs.append(sub)
+        for var0, var1, values in self.ground_conflicts:
+            if var0 in component_of:
+                subs[component_of[var0]].add_constraint(var0, var1, values)
+        for variables in self.alldiffs:
+            if variables[0] in component_of:
+                subs[component_of[variables[0]]].add_alldiff(variables)
+        for sub in subs:
+            sub.notify_of_inference(None, {}, [(var, val) for var in sub.variables for val in sub.domains[var]
+                                               if val not in self.current_domains[var]])
+        return subs
 
     def add_variables(self, variables, domain):
         """ Add the given variables to the CSP, which all have the given domain.
@@ -213,6 +405,24 @@ class CSP:
                     value_list.append((val0, val1))
         self.add_constraint(var0, var1, value_list)
 
+    def add_alldiff(self, variables):
+        """ Add an alldiff constraint over the given variables. It is kept as a
+            global constraint if the CSP was made with native_alldiff, and
+            decomposed into binary inequalities otherwise.
+            (CSP, [str]) -> None
+        """
+        if not self.native_alldiff:
+            for var1, var2 in itertools.combinations(variables, 2):
+                self.add_inequality(var1, var2)
+            return
+        for var in variables:
+            if var not in self.domains:
+                raise ValueError("Unknown variable: " + str(var))
+        index = len(self.alldiffs)
+        self.alldiffs.append(list(variables))
+        for var in variables:
+            self.alldiffs_of.setdefault(var, []).append(index)
+
     def add_equality(self, var0, var1):
         """ Add an inequality between the given variables. Raises a value error
             if they are not defined.
@@ -356,12 +566,11 @@ class CSP:
                         if len(nvars) < 3:
                             print("Error on line", lid, "badly formed alldiff")
                             return False
-                        for var1, var2 in itertools.combinations(nvars, 2):
-                            try:
-                                self.add_inequality(var1, var2)
-                            except ValueError as e:
-                                print("Error on line", lid, e.message)
-                                return False
+                        try:
+                            self.add_alldiff(nvars)
+                        except ValueError as e:
+                            print("Error on line", lid, e)
+                            return False
 
                     elif tokens[0] == "allsame":
                         nvars = tokens[1:]
@@ -400,3 +609,5 @@ class CSP:
         for var1, var2, values in self.ground_conflicts:
             out_file.write("con " + var1 + " " + var2 + " : " +
                            " : ".join([" ".join(vals) for vals in values]) + "\n")
+        for variables in self.alldiffs:
+            out_file.write("alldiff " + " ".join(variables) + "\n")
@@ -0,0 +1,114 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements the solving of a CSP one connected component at a
+    time.
+
+    When the constraint graph is disconnected, its connected components are
+    independent problems: the CSP is satisfiable if and only if each of them
+    is, and a solution is the union of their solutions. Searching them
+    together lets a failure in one component undo decisions made in another,
+    and so explore the product of their search spaces. Solving them apart
+    only explores the sum.
+
+    The components are solved from the smallest to the largest, one after
+    the other or in a pool of processes, and the first unsatisfiable one
+    stops the others.
+"""
+
+import contextlib
+import os
+import random
+import sys
+import time
+
+from parallel_search import pool_results, run_configuration
+
+
+def split_components(csp):
+    """ Return the connected components of the CSP, smallest first, and a
+        subproblem for each one (see CSP.subproblems).
+        (CSP) -> ([[str]], [CSP])
+    """
+    components = sorted(csp.connected_components(), key=len)
+    return components, csp.subproblems(components)
+
+
+def _solve_component(sub, initial_assignment, config, restart_unit, seed):
+    """ Solve one subproblem quietly with the given configuration.
+        (CSP, {str : str}, Configuration, int, int) -> ({str : str}, int)
+    """
+    random.seed(seed)
+    assignment = dict([(var, val) for var, val in initial_assignment.items() if var in sub.domains])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        solution, explored, _ = run_configuration(sub, assignment, config, restart_unit)
+    return solution, explored
+
+
+# The subproblems, initial assignment, configuration, restart unit and
+# random seed of a worker process, set once when the process starts
+_components_problem = None
+
+
+def _init_component_worker(subs, initial_assignment, config, restart_unit, seed):
+    """Set up a worker process."""
+    global _components_problem
+    sys.stdout = open(os.devnull, "w")
+    _components_problem = (subs, initial_assignment, config, restart_unit, seed)
+
+
+def _solve_component_in_worker(index):
+    """ Solve the subproblem with the given index in a worker process, and
+        return (index, assignment or None, nodes expanded).
+    """
+    subs, initial_assignment, config, restart_unit, seed = _components_problem
+    solution, explored = _solve_component(subs[index], initial_assignment, config,
+                                          restart_unit, seed + index)
+    return index, solution, explored
+
+
+def solve_components(csp, initial_assignment, config, n_workers, seed, restart_unit=100):
+    """ Solve the CSP one connected component at a time, with the given
+        configuration of the backtracking search. With more than one worker,
+        the components are solved in a pool of n_workers processes. The
+        component i, in order of size, uses the random seed seed + i.
+
+        Return the assignment found as a solution (or None if the CSP is
+        unsatisfiable), the total number of nodes expanded, the wall-clock
+        time and the sizes of the components.
+
+        (CSP, {str : str}, Configuration, int, int, int) -> ({str : str}, int, float, [int])
+    """
+    if n_workers < 1:
+        raise ValueError("Error: the components need at least one worker")
+    start_time = time.time()
+    components, subs = split_components(csp)
+    sizes = [len(component) for component in components]
+    assignment = dict(initial_assignment)
+    explored = 0
+
+    if n_workers == 1 or len(subs) == 1:
+        for index, sub in enumerate(subs):
+            solution, sub_explored = _solve_component(sub, initial_assignment, config,
+                                                      restart_unit, seed + index)
+            explored += sub_explored
+            if solution is None:
+                return None, explored, time.time() - start_time, sizes
+            assignment.update(solution)
+        return assignment, explored, time.time() - start_time, sizes
+
+    results = pool_results(n_workers, _init_component_worker,
+                           (subs, initial_assignment, config, restart_unit, seed),
+                           _solve_component_in_worker, list(range(len(subs))), "component")
+    try:
+        for _, solution, sub_explored in results:
+            explored += sub_explored
+            if solution is None:
+                assignment = None
+                break
+            assignment.update(solution)
+    finally:
+        results.close()
+    return assignment, explored, time.time() - start_time, sizes
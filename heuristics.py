@@ -14,6 +14,7 @@ Date: 18/04/2021
 This is where you need to write your heuristics for variable selection and
 value ordering.
 """
+import heapq
 from typing import Callable, Dict, List, Optional
 
 from csp import CSP
@@ -49,8 +50,9 @@ def next_variable_lex(assignment: Assignment, gamma: CSP) -> Optional[str]:
 
     """
     # gamma.variables is a list of variable names (as strings). See line 43 in
-    # csp.py. We consider them in the order they are added in.
-    for var in gamma.variables:
+    # csp.py. We consider them in the order they are added in, unless restarts
+    # shuffled it (see CSP.variable_order).
+    for var in gamma.variable_order():
         if var not in assignment:
             return var
     return None
@@ -78,22 +80,9 @@ def next_variable_md(assignment: Assignment, gamma: CSP) -> Optional[str]:
         remaining unassigned variables, we return None.
 
     """
-    cur_MD_V = ("", 0)
-    first = True
-    for var in gamma.variables:
-        if var not in assignment:
-            num_con = len(list(filter(lambda x: x not in assignment, gamma.neighbours[var]))) 
-            if first:
-                cur_MD_V = (var, num_con)
-                first = False
-            else:
-                if cur_MD_V[1] < num_con:
-                    cur_MD_V = (var, num_con)
-                
-    if cur_MD_V[0]  != "":
-        return cur_MD_V[0]
-    else:    
-        return None
+    # The number of unassigned neighbours of every variable is maintained by
+    # an UnassignedDegreeQueue as variables are assigned and unassigned.
+    return attached_watcher(gamma, UnassignedDegreeQueue, assignment).select(assignment)
     
 
 def next_variable_mrv(assignment: Assignment, gamma: CSP) -> Optional[str]:
@@ -117,23 +106,9 @@ def next_variable_mrv(assignment: Assignment, gamma: CSP) -> Optional[str]:
         remaining unassigned variables, we return None.
 
     """
-    # MRV_dict = {}
-    MRV_var = ("", 0)
-    first   = True
-    for var in gamma.variables:
-        if var not in assignment:
-            domain_size = len(list(filter(lambda x: gamma.count_conflicts(var, x) == 0, gamma.current_domains[var])))
-            if first:
-                first   = False
-                MRV_var = (var, domain_size)
-            else:
-                if MRV_var[1] > domain_size:
-                    MRV_var = (var, domain_size)
-                    # MRV_dict[var] = len(list(filter(lambda x: gamma.count_conflicts(var, x) == 0, gamma.current_domains[var])))
-    if MRV_var[0] != "":
-        return MRV_var[0]
-    else:
-        return None
+    # The number of values of every variable that cause no conflict is
+    # maintained by a ConsistentDomainQueue as the domains change.
+    return attached_watcher(gamma, ConsistentDomainQueue, assignment).select(assignment)
 
 def next_variable_md_mrv(assignment: Assignment, gamma: CSP) -> Optional[str]:
     """Implement MD heuristic, breaking ties with MRV.
@@ -157,27 +132,16 @@ def next_variable_md_mrv(assignment: Assignment, gamma: CSP) -> Optional[str]:
         remaining unassigned variables, we return None.
 
     """
-    cur_MD_V = ("", 0)
-    first = True
-    for var in gamma.variables:
-        if var not in assignment:
-            num_con = len(list(filter(lambda x: x not in assignment, gamma.neighbours[var]))) 
-            if first:
-                cur_MD_V = (var, num_con)
-                first = False
-            else:
-                if cur_MD_V[1] < num_con:
-                    cur_MD_V = (var, num_con)
-                elif cur_MD_V[1] == num_con:
-                    cur_domain_size = len(list(filter(lambda x: gamma.count_conflicts(cur_MD_V[0], x) == 0, gamma.current_domains[cur_MD_V[0]])))
-                    var_domain_size = len(list(filter(lambda x: gamma.count_conflicts(var,         x) == 0, gamma.current_domains[var])))
-                    if cur_domain_size > var_domain_size:
-                        cur_MD_V = (var, num_con)
-                
-    if cur_MD_V[0]  != "":
-        return cur_MD_V[0]
-    else:    
+    queue = attached_watcher(gamma, UnassignedDegreeQueue, assignment)
+    tied  = queue.select_all(assignment)
+    if not tied:
         return None
+    return min(tied, key=lambda var: (consistent_domain_size(var, gamma), queue.position[var]))
+
+
+def consistent_domain_size(var: str, gamma: CSP) -> int:
+    """Return the number of values of var that cause no conflict."""
+    return len(list(filter(lambda x: gamma.count_conflicts(var, x) == 0, gamma.current_domains[var])))
 
 
 def next_variable_mrv_md(assignment: Assignment, gamma: CSP) -> Optional[str]:
@@ -202,27 +166,381 @@ def next_variable_mrv_md(assignment: Assignment, gamma: CSP) -> Optional[str]:
         remaining unassigned variables, we return None.
 
     """
-    MRV_var = ("", 0)
-    first   = True
-    for var in gamma.variables:
-        if var not in assignment:
-            domain_size = len(list(filter(lambda x: gamma.count_conflicts(var, x) == 0, gamma.current_domains[var])))
-            if first:
-                first   = False
-                MRV_var = (var, domain_size)
-            else:
-                if MRV_var[1] > domain_size:
-                    MRV_var = (var, domain_size)
-                elif MRV_var[1] == domain_size:
-                    cur_num_con = len(list(filter(lambda x: x not in assignment, gamma.neighbours[MRV_var[0]]))) 
-                    var_num_con = len(list(filter(lambda x: x not in assignment, gamma.neighbours[var]))) 
-                    if var_num_con > cur_num_con:
-                        MRV_var = (var, domain_size)
-    if MRV_var[0] != "":
-        return MRV_var[0]
-    else:
+    # As for MRV, with the ties broken by a ConsistentDegreeQueue, which also
+    # maintains the number of unassigned neighbours of every variable.
+    return attached_watcher(gamma, ConsistentDegreeQueue, assignment).select(assignment)
+
+
+# -----------------------------------------------------------------------------
+# Incremental Variable Selection
+# -----------------------------------------------------------------------------
+
+
+def attached_watcher(gamma: CSP, watcher_class, assignment: Assignment):
+    """Return the watcher of the given class attached to gamma, attaching a new
+    one built from the current state of the search if there is none yet.
+    """
+    for watcher in gamma.watchers:
+        if type(watcher) is watcher_class:
+            return watcher
+    watcher = watcher_class(gamma, assignment)
+    gamma.watchers.append(watcher)
+    return watcher
+
+
+class ConsistentDomainQueue:
+    """The unassigned variables ordered by consistent domain size.
+
+    The consistent domain of a variable is made of the values of its current
+    domain that cause no conflict (see `CSP.count_conflicts`). Instead of
+    counting the conflicts of every value at every step, the queue keeps, for
+    every value val of every variable var and every neighbour ovar, the number
+    of values left in the domain of ovar that are compatible with var = val,
+    and for every value the number of constraints it conflicts with. These
+    counters are updated from the changes the CSP reports (see
+    `CSP.watchers`), so removing or restoring a value of ovar costs O(deg.d).
+    The queue keeps its own copy of the current domains to find out which
+    values changed.
+
+    The unassigned variables are kept in a heap of (consistent domain size,
+    position in the order of the variables, var) entries. Instead of being
+    updated in place, an entry is pushed again whenever its key changes, and
+    out-of-date entries are dropped when they reach the top. The heap is
+    rebuilt when the stale entries start to dominate.
+    """
+
+    def __init__(self, gamma: CSP, assignment: Assignment):
+        self.gamma    = gamma
+        self.position = dict([(var, i) for i, var in enumerate(gamma.variable_order())])
+        self.assigned = set(assignment)
+        self.domains  = dict([(var, set(gamma.current_domains[var])) for var in gamma.variables])
+
+        # support[(var, val)][ovar] is the number of values of the domain of
+        # ovar compatible with var = val, and conflicting[(var, val)] the
+        # number of neighbours with none left, plus the number of variables
+        # of a native alldiff constraint with var whose domain is {val}
+        self.support     = {}
+        self.conflicting = {}
+        for var in gamma.variables:
+            for val in gamma.domains[var]:
+                supports = {}
+                for ovar, ovals in gamma.conflicts[(var, val)].items():
+                    supports[ovar] = len([oval for oval in self.domains[ovar] if oval not in ovals])
+                self.support[(var, val)]     = supports
+                self.conflicting[(var, val)] = list(supports.values()).count(0)
+        self.sizes = dict([(var, len([val for val in self.domains[var]
+                                      if self.conflicting[(var, val)] == 0]))
+                           for var in gamma.variables])
+
+        # The variables whose key changed since the last push
+        self.changed    = set()
+        self.singletons = dict([(var, None) for var in gamma.variables])
+        for var in gamma.alldiffs_of:
+            self.update_singleton(var)
+        self.rebuild()
+
+    def key(self, var: str) -> tuple:
+        return (self.sizes[var], self.position[var])
+
+    def rebuild(self):
+        """Rebuild the heap from the unassigned variables only."""
+        self.keys = dict([(var, self.key(var))
+                          for var in self.gamma.variable_order() if var not in self.assigned])
+        self.heap = [key + (var,) for var, key in self.keys.items()]
+        heapq.heapify(self.heap)
+        self.changed = set()
+
+    def push_changed(self):
+        """Push a new entry for the unassigned variables whose key changed."""
+        for var in self.changed:
+            if var not in self.assigned:
+                key = self.key(var)
+                if self.keys.get(var) != key:
+                    self.keys[var] = key
+                    heapq.heappush(self.heap, key + (var,))
+        self.changed = set()
+        if len(self.heap) > 4 * len(self.position) + 64:
+            self.rebuild()
+
+    def add_conflicting(self, var: str, val: str, delta: int):
+        n = self.conflicting[(var, val)]
+        self.conflicting[(var, val)] = n + delta
+        if (n == 0) != (n + delta == 0) and val in self.domains[var]:
+            self.sizes[var] += 1 if n else -1
+            self.changed.add(var)
+
+    def remove(self, ovar: str, oval: str):
+        """Remove oval from the copy of the domain of ovar."""
+        self.domains[ovar].remove(oval)
+        if self.conflicting[(ovar, oval)] == 0:
+            self.sizes[ovar] -= 1
+            self.changed.add(ovar)
+        support = self.support
+        for var, vals in self.gamma.conflicts[(ovar, oval)].items():
+            for val in self.gamma.domains[var]:
+                if val not in vals:
+                    supports = support[(var, val)]
+                    supports[ovar] -= 1
+                    if supports[ovar] == 0:
+                        self.add_conflicting(var, val, 1)
+
+    def restore(self, ovar: str, oval: str):
+        """Add oval back to the copy of the domain of ovar."""
+        self.domains[ovar].add(oval)
+        if self.conflicting[(ovar, oval)] == 0:
+            self.sizes[ovar] += 1
+            self.changed.add(ovar)
+        support = self.support
+        for var, vals in self.gamma.conflicts[(ovar, oval)].items():
+            for val in self.gamma.domains[var]:
+                if val not in vals:
+                    supports = support[(var, val)]
+                    supports[ovar] += 1
+                    if supports[ovar] == 1:
+                        self.add_conflicting(var, val, -1)
+
+    def update_singleton(self, ovar: str):
+        """Count the conflicts with the native alldiff constraints of ovar
+        when its domain becomes, or stops being, a single value."""
+        domain = self.domains[ovar]
+        singleton = next(iter(domain)) if len(domain) == 1 else None
+        if singleton == self.singletons[ovar]:
+            return
+        for val, delta in [(self.singletons[ovar], -1), (singleton, 1)]:
+            if val is not None:
+                for index in self.gamma.alldiffs_of[ovar]:
+                    for var in self.gamma.alldiffs[index]:
+                        if var != ovar and (var, val) in self.conflicting:
+                            self.add_conflicting(var, val, delta)
+        self.singletons[ovar] = singleton
+
+    def update(self, var: str):
+        """Bring the copy of the domain of var up to date with the CSP."""
+        domain  = self.domains[var]
+        current = self.gamma.current_domains[var]
+        for val in domain - current:
+            self.remove(var, val)
+        for val in current - domain:
+            self.restore(var, val)
+        if var in self.gamma.alldiffs_of:
+            self.update_singleton(var)
+
+    def on_assign(self, var: str):
+        self.assigned.add(var)
+        self.keys.pop(var, None)
+        self.update(var)
+        self.push_changed()
+
+    def on_unassign(self, var: str):
+        self.assigned.discard(var)
+        self.update(var)
+        self.changed.add(var)
+        self.push_changed()
+
+    def on_domains_changed(self, variables):
+        for var in variables:
+            self.update(var)
+        self.push_changed()
+
+    def select(self, assignment: Assignment) -> Optional[str]:
+        """Return the first unassigned variable with the smallest key."""
+        heap = self.heap
+        while heap:
+            var = heap[0][-1]
+            if var in assignment or var in self.assigned or self.keys.get(var) != heap[0][:-1]:
+                heapq.heappop(heap)
+                continue
+            return var
+        return None
+
+
+class ConsistentDegreeQueue(ConsistentDomainQueue):
+    """A ConsistentDomainQueue that breaks the ties between the variables with
+    the smallest consistent domain by their number of unassigned neighbours,
+    maintained as in UnassignedDegreeQueue. The entries of the heap are
+    (consistent domain size, -counter, position, var).
+    """
+
+    def __init__(self, gamma: CSP, assignment: Assignment):
+        self.degrees = dict([(var, len([x for x in gamma.neighbours[var] if x not in assignment]))
+                             for var in gamma.variables])
+        super().__init__(gamma, assignment)
+
+    def key(self, var: str) -> tuple:
+        return (self.sizes[var], -self.degrees[var], self.position[var])
+
+    def on_assign(self, var: str):
+        for x in self.gamma.neighbours[var]:
+            self.degrees[x] -= 1
+        self.changed.update(self.gamma.neighbours[var])
+        super().on_assign(var)
+
+    def on_unassign(self, var: str):
+        for x in self.gamma.neighbours[var]:
+            self.degrees[x] += 1
+        self.changed.update(self.gamma.neighbours[var])
+        super().on_unassign(var)
+
+
+class UnassignedDegreeQueue:
+    """The unassigned variables ordered by number of unassigned neighbours.
+
+    The counter of each variable is updated in O(deg) when one of its
+    neighbours is assigned or unassigned (see `CSP.watchers`), and the
+    variables are kept in a heap of (-counter, position in the order of the
+    variables, var) entries that is updated lazily like the one of
+    ConsistentDomainQueue.
+    """
+
+    def __init__(self, gamma: CSP, assignment: Assignment):
+        self.gamma    = gamma
+        self.position = dict([(var, i) for i, var in enumerate(gamma.variable_order())])
+        self.assigned = set(assignment)
+        self.degrees  = dict([(var, len([x for x in gamma.neighbours[var] if x not in self.assigned]))
+                              for var in gamma.variable_order()])
+        self.rebuild()
+
+    def rebuild(self):
+        """Rebuild the heap from the unassigned variables only."""
+        self.heap = [(-self.degrees[var], self.position[var], var)
+                     for var in self.gamma.variable_order() if var not in self.assigned]
+        heapq.heapify(self.heap)
+
+    def push(self, var: str):
+        heapq.heappush(self.heap, (-self.degrees[var], self.position[var], var))
+
+    def on_assign(self, var: str):
+        self.assigned.add(var)
+        for x in self.gamma.neighbours[var]:
+            self.degrees[x] -= 1
+            if x not in self.assigned:
+                self.push(x)
+        if len(self.heap) > 4 * len(self.position) + 64:
+            self.rebuild()
+
+    def on_unassign(self, var: str):
+        self.assigned.discard(var)
+        for x in self.gamma.neighbours[var]:
+            self.degrees[x] += 1
+            if x not in self.assigned:
+                self.push(x)
+        self.push(var)
+
+    def on_domains_changed(self, variables):
+        pass
+
+    def _valid(self, entry, assignment: Assignment) -> bool:
+        negated_degree, _, var = entry
+        return var not in assignment and var not in self.assigned \
+            and -negated_degree == self.degrees[var]
+
+    def select(self, assignment: Assignment) -> Optional[str]:
+        """Return the first unassigned variable with the most unassigned neighbours."""
+        heap = self.heap
+        while heap:
+            if self._valid(heap[0], assignment):
+                return heap[0][2]
+            heapq.heappop(heap)
         return None
 
+    def select_all(self, assignment: Assignment) -> List[str]:
+        """Return all the unassigned variables with the most unassigned neighbours,
+        in the order of gamma.variable_order()."""
+        heap = self.heap
+        tied = {}
+        while heap:
+            entry = heap[0]
+            if not self._valid(entry, assignment):
+                heapq.heappop(heap)
+            elif tied and entry[0] != next(iter(tied.values()))[0]:
+                break
+            else:
+                tied[entry[2]] = heapq.heappop(heap)
+        for entry in tied.values():
+            heapq.heappush(heap, entry)
+        return sorted(tied, key=self.position.get)
+
+
+# -----------------------------------------------------------------------------
+# Conflict-Directed Variable Selection
+# -----------------------------------------------------------------------------
+
+
+def next_variable_dom_wdeg(assignment: Assignment, gamma: CSP) -> Optional[str]:
+    """Implement the dom/wdeg heuristic.
+
+    Choose the unassigned variable with the smallest ratio of its current
+    domain size to its weighted degree, the sum of the weights of its
+    constraints with unassigned variables. The weights are increased by the
+    search and the inference functions every time a constraint causes a
+    failure (see `CSP.increase_conflict_weight`), so the search learns to
+    branch first on the variables involved in the hard part of the problem.
+    Ties are broken by lexicographic order.
+
+    Unlike `next_variable_mrv`, the domain size is the number of values left
+    in `gamma.current_domains`, not the number of values that cause no
+    conflict, so this is best used with `-i forward` or `-i arc`.
+
+    Parameters
+    ----------
+    assignment : Dict[str, str]
+        A Python dictionary that maps variable names to values.
+    gamma : CSP
+        An instance of the class CSP, representing the constraint network
+        to which we are looking for a solution.
+
+    Returns
+    -------
+    variable : Optional[str]
+        The name of the next variable chosen by this heuristic. If there are no
+        remaining unassigned variables, we return None.
+
+    """
+    return select_min_domain_ratio(assignment, gamma, lambda var: gamma.weighted_degree(var, assignment))
+
+
+def next_variable_dom_ddeg(assignment: Assignment, gamma: CSP) -> Optional[str]:
+    """Implement the dom/ddeg heuristic.
+
+    Choose the unassigned variable with the smallest ratio of its current
+    domain size to its dynamic degree, the number of its unassigned
+    neighbours, which is maintained by an UnassignedDegreeQueue. Ties are
+    broken by lexicographic order.
+
+    Parameters
+    ----------
+    assignment : Dict[str, str]
+        A Python dictionary that maps variable names to values.
+    gamma : CSP
+        An instance of the class CSP, representing the constraint network
+        to which we are looking for a solution.
+
+    Returns
+    -------
+    variable : Optional[str]
+        The name of the next variable chosen by this heuristic. If there are no
+        remaining unassigned variables, we return None.
+
+    """
+    degrees = attached_watcher(gamma, UnassignedDegreeQueue, assignment).degrees
+    return select_min_domain_ratio(assignment, gamma, degrees.get)
+
+
+def select_min_domain_ratio(assignment: Assignment, gamma: CSP, degree: Callable) -> Optional[str]:
+    """Return the first unassigned variable with the smallest domain size to
+    degree ratio. A variable of degree 0 has an infinite ratio.
+
+    The ratios are compared by cross-multiplying, so there is no rounding.
+    """
+    best, best_size, best_degree = None, 0, 0
+    for var in gamma.variable_order():
+        if var not in assignment:
+            size, var_degree = gamma.domain_size(var), degree(var)
+            if best is None or size * best_degree < best_size * var_degree:
+                best, best_size, best_degree = var, size, var_degree
+    return best
+
+
 # -----------------------------------------------------------------------------
 # Value Ordering Heuristics
 # -----------------------------------------------------------------------------
@@ -316,6 +634,33 @@ def count_conflict_values(var: str, val : str, assignment: Assignment, gamma: CS
     return n_conflict_value
 
 
+def phase_saving(order_domain_values: Callable) -> Callable:
+    """Add phase saving to a value ordering heuristic.
+
+    The returned value ordering function tries first the last value assigned
+    to the variable (see `CSP.phases`), then the other values in the order of
+    the given heuristic. With restarts, this steers the search back to the
+    partial assignments it had found before restarting.
+
+    Parameters
+    ----------
+    order_domain_values : Callable
+        A value ordering function, such as `value_ordering_lex`.
+
+    Returns
+    -------
+    ordering_function : Callable
+        The value ordering function with phase saving.
+    """
+    def value_ordering_phase(var: str, assignment: Assignment, gamma: CSP) -> List[str]:
+        values = order_domain_values(var, assignment, gamma)
+        phase  = gamma.phases.get(var)
+        if phase is not None and values and values[0] != phase and phase in values:
+            values = [phase] + [val for val in values if val != phase]
+        return values
+    return value_ordering_phase
+
+
 # -------------------------------------------------------------------------------
 # Functions used by the system to select from the above heuristics for the search
 # You do not need to look any further.
@@ -333,6 +678,10 @@ def get_variable_selection_function(variable_heuristic: str) -> Callable:
         return next_variable_md_mrv
     if variable_heuristic == "mrv-md":
         return next_variable_mrv_md
+    if variable_heuristic == "dom-wdeg":
+        return next_variable_dom_wdeg
+    if variable_heuristic == "dom-ddeg":
+        return next_variable_dom_ddeg
 
     raise ValueError(f"Error: the variable selection heuristic "
                      f"'{variable_heuristic}' is not supported")
@@ -13,10 +13,12 @@ Date: 18/04/2021
 """
 
 import collections
+import itertools
 from typing import Callable, Dict, List, Optional, Tuple
 import copy
 
 from csp import CSP
+from numpy_inference import arc_consistency_numpy, require_numpy
 
 Assignment = Dict[str, str]
 Pruned = List[Tuple[str, str]]
@@ -36,13 +38,16 @@ def forward_checking(var: str, assignment: Assignment, gamma: CSP) -> Optional[P
         gamma : CSP
             An instance of the class CSP, representing the constraint network
             to which we are looking for a solution. The function cannot change
-            anything in `gamma`.
+            the domains in `gamma`. It may only increase the weight of the
+            constraint that causes a failure (see
+            `CSP.increase_conflict_weight`).
 
         Returns
         -------
         pruned_list : Optional[Pruned]
             In the case that the algorithm detects a conflict, the assignment and
-            CSP should remain unchanged and the function should return None.
+            the domains of the CSP should remain unchanged and the function
+            should return None.
 
             Otherwise, the algorithm should return a pruned_list, which is a list
             of (variable, value) pairs that will be pruned out of the domains of
@@ -52,11 +57,12 @@ def forward_checking(var: str, assignment: Assignment, gamma: CSP) -> Optional[P
     
     val          = assignment[var]
     Pruned_list  = []
-    temp_domains = dict([(x, len(y)) for x,y in gamma.current_domains.items() if x in gamma.neighbours[var]])
+    temp_domains = dict([(x, len(gamma.current_domains[x])) for x in gamma.neighbours[var]])
     for neighbor, neighbor_conflicts_set in gamma.conflicts[(var, val)].items():
         for domain_val in gamma.current_domains[neighbor]:
             if domain_val in neighbor_conflicts_set:
                 if temp_domains[neighbor] == 1:
+                    gamma.increase_conflict_weight(var, neighbor)
                     return None
                 else:
                     temp_domains[neighbor] = temp_domains[neighbor] - 1
@@ -79,78 +85,290 @@ def arc_consistency(var: Optional[str], assignment: Assignment, gamma: CSP) -> O
         gamma : CSP
             An instance of the class CSP, representing the constraint network
             to which we are looking for a solution. The function cannot change
-            anything in `gamma`.
+            the domains in `gamma`. It may only increase the weight of the
+            constraint that causes a failure (see
+            `CSP.increase_conflict_weight`).
 
         Returns
         -------
         pruned_list : Optional[Pruned]
             In the case that the algorithm detects a conflict, the assignment and
-            CSP should remain unchanged and the function should return None.
+            the domains of the CSP should remain unchanged and the function
+            should return None.
 
             Otherwise, the algorithm should return a pruned_list, which is a list
             of (variable, value) pairs that will be pruned out of the domains of
             the variables in the problem. Think of this as the "edits" that are
             required to be done on the variable domains.
     """
-    
+    return propagate_arcs(var, gamma, Revise)
+
+def propagate_arcs(var: Optional[str], gamma: CSP, revise: Callable) -> Optional[Pruned]:
+    """Run the AC-3 main loop, revising arcs with the given revise function.
+
+        The domains are copied on write: `temp_domains` only holds the domains
+        that have actually shrunk, every other domain is read directly from
+        `gamma.current_domains`. So a call costs time proportional to the arcs
+        it revises, not to the size of the whole CSP, and gamma is never
+        changed, except for the weight of the arc that wipes out a domain (see
+        `CSP.increase_conflict_weight`).
+    """
     pruned_list  = []
-    temp_domains = dict([(x, list(y)) for x, y in gamma.current_domains.items()])
-    
+    temp_domains = {}
+
     if var == None:
         M = set([(x,y) for x in gamma.variables for y in gamma.neighbours[x]])
-        while len(M) != 0:
-            X_i, X_j = M.pop()
-            no_conflict, Xi_pruned_list = Revise(gamma, temp_domains, X_i, X_j)
-            if not no_conflict:
-                return None
-            if len(Xi_pruned_list) != 0:
-                pruned_list.extend(Xi_pruned_list)
-                for X_k in gamma.neighbours[X_i]:
-                    if X_k != X_j:
-                        M.add((X_k, X_i))
     else:
         M = set([(y, var) for y in gamma.neighbours[var]])
-        while len(M) != 0:
-            X_i, X_j = M.pop()
-            no_conflict, Xi_pruned_list = Revise(gamma, temp_domains, X_i, X_j)
-            if not no_conflict:
-                return None
-            if len(Xi_pruned_list) != 0:
-                pruned_list.extend(Xi_pruned_list)
-                for X_k in gamma.neighbours[X_i]:
-                    if X_k != X_j:
-                        M.add((X_k, X_i))
+    while len(M) != 0:
+        X_i, X_j = M.pop()
+        no_conflict, Xi_pruned_list = revise(gamma, temp_domains, X_i, X_j)
+        if not no_conflict:
+            gamma.increase_conflict_weight(X_i, X_j)
+            return None
+        if len(Xi_pruned_list) != 0:
+            pruned_list.extend(Xi_pruned_list)
+            for X_k in gamma.neighbours[X_i]:
+                if X_k != X_j:
+                    M.add((X_k, X_i))
     return pruned_list
 
-def Revise(gamma: CSP, temp_domains: list, X_i: str, X_j: str):
-    """AI is creating summary for Revise
+def shrink_domain(gamma: CSP, temp_domains: dict, x: str, removed: list) -> bool:
+    """Remove the given values from the domain of x in temp_domains, copying it
+    first if this is the first time it shrinks. Return False if it becomes
+    empty, in which case nothing is changed.
 
-        Args:
-            gamma (CSP): [description]
-            X_i (str): [description]
-            X_j (str): [description]
+    Domains in temp_domains are never empty, so `temp_domains.get(x) or
+    gamma.current_domains[x]` is always the domain of x as shrunk so far.
+    """
+    domain = temp_domains.get(x)
+    if domain is None:
+        domain = gamma.current_domains[x]
+        if len(removed) == len(domain):
+            return False
+        temp_domains[x] = domain - set(removed)
+    else:
+        if len(removed) == len(domain):
+            return False
+        domain.difference_update(removed)
+    return True
 
-        Returns:
-            [type]: [description]
-    """  
-    Xi_pruned_list = []
-    Xi_domain_size = len(temp_domains[X_i])
-    
-    for Xi_val in temp_domains[X_i]:
-        any_valid = False
-        for Xj_domain_val in temp_domains[X_j]:
-            if Xj_domain_val not in gamma.conflicts[(X_i, Xi_val)][X_j]:
-                any_valid = True
+def Revise(gamma: CSP, temp_domains: dict, X_i: str, X_j: str):
+    """Revise the arc (X_i, X_j).
+
+        Remove from the domain of X_i the values without a support in the
+        domain of X_j. Returns (False, []) if the domain of X_i is wiped out,
+        and otherwise (True, the list of (X_i, value) pairs removed from it).
+    """
+    Xj_domain = temp_domains.get(X_j) or gamma.current_domains[X_j]
+    removed   = []
+
+    for Xi_val in temp_domains.get(X_i) or gamma.current_domains[X_i]:
+        Xi_conflicts = gamma.conflicts[(X_i, Xi_val)][X_j]
+        for Xj_domain_val in Xj_domain:
+            if Xj_domain_val not in Xi_conflicts:
                 break
-        if not any_valid:
-            if Xi_domain_size == 1:
-                return (False, [])
+        else:
+            removed.append(Xi_val)
+
+    if removed and not shrink_domain(gamma, temp_domains, X_i, removed):
+        return (False, [])
+    return (True, [(X_i, Xi_val) for Xi_val in removed])
+
+def arc_consistency_rm(var: Optional[str], assignment: Assignment, gamma: CSP) -> Optional[Pruned]:
+    """AC-3rm: AC-3 with residual supports.
+
+        Same interface and result as `arc_consistency`, but for each
+        (X_i, value, X_j) the last support found in X_j is cached in
+        `gamma.residues` and checked first, so most revisions cost one
+        membership test per value instead of a scan of X_j's domain. Residues
+        are multidirectional: finding that b in X_j supports a in X_i also
+        records a as the residue of (X_j, b, X_i).
+    """
+    return propagate_arcs(var, gamma, Revise_rm)
+
+def Revise_rm(gamma: CSP, temp_domains: dict, X_i: str, X_j: str):
+    """Revise the arc (X_i, X_j) using and updating the residual supports.
+
+        Returns (False, []) if the domain of X_i is wiped out, and otherwise
+        (True, the list of (X_i, value) pairs removed from it).
+    """
+    residues  = gamma.residues
+    Xj_domain = temp_domains.get(X_j) or gamma.current_domains[X_j]
+    removed   = []
+
+    for Xi_val in temp_domains.get(X_i) or gamma.current_domains[X_i]:
+        residue = residues.get((X_i, Xi_val, X_j))
+        if residue is not None and residue in Xj_domain:
+            continue
+        Xi_conflicts = gamma.conflicts[(X_i, Xi_val)][X_j]
+        for Xj_domain_val in Xj_domain:
+            if Xj_domain_val not in Xi_conflicts:
+                residues[(X_i, Xi_val, X_j)] = Xj_domain_val
+                residues[(X_j, Xj_domain_val, X_i)] = Xi_val
+                break
+        else:
+            removed.append(Xi_val)
+
+    if removed and not shrink_domain(gamma, temp_domains, X_i, removed):
+        return (False, [])
+    return (True, [(X_i, Xi_val) for Xi_val in removed])
+
+def alldiff_propagation(var: Optional[str], assignment: Assignment, gamma: CSP) -> Optional[Pruned]:
+    """Propagate the native alldiff constraints of the CSP.
+
+        Binary constraints are handled by forward checking on `var`. Then each
+        alldiff constraint involving a changed variable is made generalised
+        arc consistent with Regin's matching-based filter, until nothing
+        changes. This subsumes naked and hidden singles, and also detects
+        Hall sets, e.g. two cells of a Sudoku row that can only be {1, 2}.
+
+        The interface is the same as for the other inference functions, and
+        like them it only works on a copy-on-write overlay of the domains, so
+        `gamma` is left unchanged, except for the weights of the constraints
+        of a failed alldiff (see `CSP.increase_conflict_weight`).
+    """
+    pruned_list  = []
+    temp_domains = {}
+
+    if var == None:
+        queue = set(range(len(gamma.alldiffs)))
+    else:
+        binary_pruned = forward_checking(var, assignment, gamma)
+        if binary_pruned is None:
+            return None
+        removed = collections.defaultdict(list)
+        for x, x_val in binary_pruned:
+            removed[x].append(x_val)
+        for x, x_vals in removed.items():
+            shrink_domain(gamma, temp_domains, x, x_vals)
+        pruned_list.extend(binary_pruned)
+        queue = set(gamma.alldiffs_of.get(var, []))
+        for x in removed:
+            queue.update(gamma.alldiffs_of.get(x, []))
+
+    while queue:
+        index   = queue.pop()
+        domains = dict([(x, temp_domains.get(x) or gamma.current_domains[x])
+                        for x in gamma.alldiffs[index]])
+        removed = filter_alldiff(domains)
+        if removed is None:
+            increase_alldiff_weight(gamma, index)
+            return None
+        for x, x_vals in removed.items():
+            if not shrink_domain(gamma, temp_domains, x, x_vals):
+                increase_alldiff_weight(gamma, index)
+                return None
+            pruned_list.extend([(x, x_val) for x_val in x_vals])
+            queue.update([other for other in gamma.alldiffs_of[x] if other != index])
+    return pruned_list
+
+def increase_alldiff_weight(gamma: CSP, index: int):
+    """Increase the weights of all the pairs of variables of a failed alldiff."""
+    for x, y in itertools.combinations(gamma.alldiffs[index], 2):
+        gamma.increase_conflict_weight(x, y)
+
+def filter_alldiff(domains: Dict[str, set]) -> Optional[Dict[str, list]]:
+    """Regin's filter for a single alldiff constraint.
+
+        Given the domains of the variables of the constraint, return None if
+        the constraint cannot be satisfied, and otherwise a dictionary mapping
+        variables to the values that belong to no solution of the constraint.
+
+        A value is kept iff its edge in the variable/value graph belongs to
+        some maximum matching, that is iff it is matched, lies on an
+        alternating path starting at a free value, or lies on an alternating
+        cycle (both ends in the same strongly connected component).
+    """
+    matched = {}  # variable -> value
+    match   = {}  # value -> variable
+    for x in domains:
+        if not _augment(x, domains, match, matched, set()):
+            return None
+
+    users = collections.defaultdict(list)
+    for x, x_domain in domains.items():
+        for x_val in x_domain:
+            users[x_val].append(x)
+
+    # Matched edges go from variables to values and the others from values to
+    # variables, so directed paths in this graph are alternating paths.
+    def successors(node):
+        kind, name = node
+        if kind == 0:
+            return [(1, matched[name])]
+        return [(0, y) for y in users[name] if matched[y] != name]
+
+    reached = set([val for val in users if val not in match])
+    frontier = list(reached)
+    while frontier:
+        for kind, y in successors((1, frontier.pop())):
+            y_val = matched[y]
+            if y_val not in reached:
+                reached.add(y_val)
+                frontier.append(y_val)
+
+    nodes = [(0, x) for x in domains] + [(1, val) for val in users]
+    component = _strongly_connected_components(nodes, successors)
+
+    removed = {}
+    for x, x_domain in domains.items():
+        for x_val in x_domain:
+            if x_val != matched[x] and x_val not in reached \
+                    and component[(0, x)] != component[(1, x_val)]:
+                removed.setdefault(x, []).append(x_val)
+    return removed
+
+def _augment(x, domains, match, matched, visited) -> bool:
+    """Look for an augmenting path from the unmatched variable x."""
+    for x_val in domains[x]:
+        if x_val not in visited:
+            visited.add(x_val)
+            y = match.get(x_val)
+            if y is None or _augment(y, domains, match, matched, visited):
+                match[x_val] = x
+                matched[x] = x_val
+                return True
+    return False
+
+def _strongly_connected_components(nodes, successors) -> dict:
+    """Iterative Tarjan. Map each node to the root of its component."""
+    index, low, component = {}, {}, {}
+    stack, on_stack = [], set()
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
             else:
-                Xi_domain_size = Xi_domain_size - 1
-                Xi_pruned_list.append((X_i, Xi_val))
-                temp_domains[X_i].remove(Xi_val)
-                
-    return (True, Xi_pruned_list)
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component[member] = node
+                        if member == node:
+                            break
+    return component
 
 # ------------- 1--------------------
     # def arc_consistency2(var: Optional[str], assignment: Assignment, gamma: CSP) -> Optional[Pruned]:
@@ -168,13 +386,16 @@ def Revise(gamma: CSP, temp_domains: list, X_i: str, X_j: str):
     #         gamma : CSP
     #             An instance of the class CSP, representing the constraint network
     #             to which we are looking for a solution. The function cannot change
-    #             anything in `gamma`.
+    #             the domains in `gamma`. It may only increase the weight of the
+    #             constraint that causes a failure (see
+    #             `CSP.increase_conflict_weight`).
 
     #         Returns
     #         -------
     #         pruned_list : Optional[Pruned]
     #             In the case that the algorithm detects a conflict, the assignment and
-    #             CSP should remain unchanged and the function should return None.
+    #             the domains of the CSP should remain unchanged and the function
+    #             should return None.
 
     #             Otherwise, the algorithm should return a pruned_list, which is a list
     #             of (variable, value) pairs that will be pruned out of the domains of
@@ -243,13 +464,16 @@ def Revise(gamma: CSP, temp_domains: list, X_i: str, X_j: str):
     #         gamma : CSP
     #             An instance of the class CSP, representing the constraint network
     #             to which we are looking for a solution. The function cannot change
-    #             anything in `gamma`.
+    #             the domains in `gamma`. It may only increase the weight of the
+    #             constraint that causes a failure (see
+    #             `CSP.increase_conflict_weight`).
 
     #         Returns
     #         -------
     #         pruned_list : Optional[Pruned]
     #             In the case that the algorithm detects a conflict, the assignment and
-    #             CSP should remain unchanged and the function should return None.
+    #             the domains of the CSP should remain unchanged and the function
+    #             should return None.
 
     #             Otherwise, the algorithm should return a pruned_list, which is a list
     #             of (variable, value) pairs that will be pruned out of the domains of
@@ -288,13 +512,16 @@ def Revise(gamma: CSP, temp_domains: list, X_i: str, X_j: str):
     #         gamma : CSP
     #             An instance of the class CSP, representing the constraint network
     #             to which we are looking for a solution. The function cannot change
-    #             anything in `gamma`.
+    #             the domains in `gamma`. It may only increase the weight of the
+    #             constraint that causes a failure (see
+    #             `CSP.increase_conflict_weight`).
 
     #         Returns
     #         -------
     #         pruned_list : Optional[Pruned]
     #             In the case that the algorithm detects a conflict, the assignment and
-    #             CSP should remain unchanged and the function should return None.
+    #             the domains of the CSP should remain unchanged and the function
+    #             should return None.
 
     #             Otherwise, the algorithm should return a pruned_list, which is a list
     #             of (variable, value) pairs that will be pruned out of the domains of
@@ -323,11 +550,21 @@ def Revise(gamma: CSP, temp_domains: list, X_i: str, X_j: str):
 # -------------------------------------------------------------------------------
 
 def get_inference_function(inference_type: str) -> Callable:
-    """Return the function that does the specified inference."""
+    """Return the function that does the specified inference.
+
+    Raises an ImportError for "arc-np" if NumPy is not installed.
+    """
     if inference_type == "forward":
         return forward_checking
     if inference_type == "arc":
         return arc_consistency
+    if inference_type == "arc-rm":
+        return arc_consistency_rm
+    if inference_type == "alldiff":
+        return alldiff_propagation
+    if inference_type == "arc-np":
+        require_numpy()
+        return arc_consistency_numpy
 
     # If no inference is specified, we simply do nothing.
     def no_inference(var, assignment, csp):
@@ -0,0 +1,168 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements min-conflicts local search.
+
+    The search starts from a complete assignment, built greedily, and then
+    repeatedly picks a variable involved in a violated constraint and moves it
+    to the value with the fewest conflicts, until no constraint is violated or
+    the maximum number of steps is reached.
+
+    To make each step cheap, the number of conflicts of every (variable, value)
+    pair with the current assignment is kept in a table which is updated
+    incrementally: moving X from a to b only changes the entries of the values
+    of the neighbours of X that conflict with a or b, so a step costs O(deg)
+    instead of a re-evaluation of the whole assignment.
+
+    Two standard moves help to escape from local minima:
+      - random walk: with probability walk_probability, the chosen variable is
+        given a random value instead of the best one;
+      - tabu: after a move from a to b, the pair (X, a) is tabu for
+        tabu_tenure steps, unless it would give the best assignment so far.
+
+    Local search is incomplete: when it fails, it cannot tell whether the
+    problem is unsatisfiable.
+"""
+
+import random
+import time
+
+
+def search(csp, initial_assignment, select_unassigned_variable,
+           order_domain_values, max_steps, walk_probability=0.02, tabu_tenure=10):
+    """ Do min-conflicts local search on the CSP.
+
+        The variables of the initial assignment are kept fixed. The values
+        are taken from the current domains, so preprocessing prunes the
+        search space. order_domain_values breaks ties when building the
+        initial assignment. select_unassigned_variable is not used, it is
+        only taken for compatibility with backtracking_search.search.
+
+        Return the assignment found as a solution, the number of steps taken
+        and the search time. If no solution was found within max_steps steps,
+        None will be returned in place of the solution.
+
+        (CSP, {str : str}, function, function, int, float, int) -> ({str : str}, int, float)
+    """
+    if csp.alldiffs:
+        raise ValueError("Error: local search does not support native alldiff "
+                         "constraints, use '-a binary'")
+
+    start_time = time.time()
+    values = dict([(var, [val for val in csp.domains[var] if val in csp.current_domains[var]])
+                   for var in csp.variables])
+
+    # For each (var, val) pair, the neighbours of var with the values that
+    # conflict with it. Only the non-empty ones are kept.
+    rows = {}
+    for var in csp.variables:
+        for val in values[var]:
+            rows[(var, val)] = [(ovar, ovals) for ovar, ovals in csp.conflicts[(var, val)].items() if ovals]
+
+    # table[var][val] is the number of neighbours whose current value
+    # conflicts with var = val
+    table = dict([(var, dict([(val, 0) for val in values[var]])) for var in csp.variables])
+    assignment = {}
+
+    def place(var, val, sign):
+        """Add (sign = 1) or remove (sign = -1) the conflicts of var = val."""
+        for ovar, ovals in rows[(var, val)]:
+            ovar_table = table[ovar]
+            for oval in ovals:
+                if oval in ovar_table:
+                    ovar_table[oval] += sign
+
+    # Build the initial assignment greedily, in the order of the variables
+    for var, val in initial_assignment.items():
+        assignment[var] = val
+        place(var, val, 1)
+    for var in csp.variables:
+        if var not in assignment:
+            candidates = [val for val in order_domain_values(var, assignment, csp) if val in table[var]]
+            val = min(candidates, key=table[var].get)
+            assignment[var] = val
+            place(var, val, 1)
+
+    # The variables that can move and are involved in a violated constraint,
+    # kept in a list with the position of each variable for O(1) updates
+    movable = [var for var in csp.variables if var not in initial_assignment]
+    conflicted = []
+    position = {}
+
+    def update(var):
+        """Put var in or out of the conflicted list according to the table."""
+        if table[var][assignment[var]] > 0:
+            if var not in position:
+                position[var] = len(conflicted)
+                conflicted.append(var)
+        elif var in position:
+            index = position.pop(var)
+            last = conflicted.pop()
+            if last != var:
+                conflicted[index] = last
+                position[last] = index
+
+    for var in movable:
+        update(var)
+
+    # The number of violated constraints, each counted once from either end
+    n_violated = sum([table[var][assignment[var]] for var in csp.variables]) // 2
+    best_violated = n_violated
+    tabu = {}
+
+    n_steps = 0
+    while conflicted and n_steps < max_steps:
+        n_steps += 1
+        var = random.choice(conflicted)
+        old_val = assignment[var]
+        var_table = table[var]
+
+        if random.random() < walk_probability:
+            val = random.choice(values[var])
+        else:
+            # The best non-tabu value, or a tabu one that beats the best so far
+            best = None
+            candidates = []
+            for val in values[var]:
+                if val == old_val:
+                    continue
+                n_conflicts = var_table[val]
+                if tabu.get((var, val), 0) > n_steps and \
+                        n_violated + n_conflicts - var_table[old_val] >= best_violated:
+                    continue
+                if best is None or n_conflicts < best:
+                    best = n_conflicts
+                    candidates = [val]
+                elif n_conflicts == best:
+                    candidates.append(val)
+            if not candidates or best > var_table[old_val]:
+                continue
+            val = random.choice(candidates)
+
+        if val == old_val:
+            continue
+
+        n_violated += var_table[val] - var_table[old_val]
+        best_violated = min(best_violated, n_violated)
+        tabu[(var, old_val)] = n_steps + tabu_tenure
+        place(var, old_val, -1)
+        place(var, val, 1)
+        assignment[var] = val
+        update(var)
+        for ovar, _ in rows[(var, old_val)] + rows[(var, val)]:
+            if ovar in table and ovar not in initial_assignment:
+                update(ovar)
+
+    soln_time = time.time() - start_time
+    if conflicted or n_violated:
+        print("No solution found!")
+        print("Steps:", n_steps)
+        print("Time:", soln_time)
+        return None, n_steps, soln_time
+
+    print("Solved problem!")
+    print("Steps:", n_steps)
+    print("Time:", soln_time)
+    return assignment, n_steps, soln_time
@@ -0,0 +1,173 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements the counting of the solutions of an n-ary CSP
+    (#CSP) with component caching.
+
+    The constraints are tables: a tuple of variables and the set of tuples of
+    values they may take. The counter branches on one variable at a time and
+    restricts each table to the tuples that agree with the value. What is
+    left of the CSP, the residual CSP, often falls apart into connected
+    components that share no constraint, and its count is the product of
+    theirs. Each component is counted once: its count is cached under its
+    signature, the domains of its variables and its residual tables, so an
+    identical component reached by another branch costs a dictionary lookup.
+
+    A count is not a single number but a tally: for the given list of
+    counted values, it maps the number of variables taking each of them to
+    the number of solutions that do. A constraint over every variable, such
+    as the number of pits in the Wumpus World, would make the whole CSP one
+    component; counting by tally lets such a constraint be applied to the
+    result instead. Tallies above the given caps are dropped as they are
+    combined.
+"""
+
+import sys
+
+
+def _tally_product(first, second, caps):
+    """ Combine the tallies of two independent components.
+        ({(int) : int}, {(int) : int}, (int)) -> {(int) : int}
+    """
+    product = {}
+    for key1, n1 in first.items():
+        for key2, n2 in second.items():
+            key = tuple([k1 + k2 for k1, k2 in zip(key1, key2)])
+            if any([k > cap for k, cap in zip(key, caps)]):
+                continue
+            product[key] = product.get(key, 0) + n1 * n2
+    return product
+
+
+def restrict(constraints, var, val):
+    """ Restrict the tables to the assignment of val to var. The tables of
+        var lose var and keep the tuples with val in its place; those left
+        over no variable are dropped. Return the new list of tables, or None
+        if one of them has no tuple left.
+        ([((str), frozenset([(str)]))], str, str) -> [((str), frozenset([(str)]))]
+    """
+    restricted = []
+    for scope, tuples in constraints:
+        if var not in scope:
+            restricted.append((scope, tuples))
+            continue
+        pos = scope.index(var)
+        tuples = frozenset([tup[:pos] + tup[pos + 1:] for tup in tuples if tup[pos] == val])
+        if not tuples:
+            return None
+        if len(scope) > 1:
+            restricted.append((scope[:pos] + scope[pos + 1:], tuples))
+    return restricted
+
+
+def components(variables, constraints):
+    """ Split the variables into the connected components of the constraint
+        graph, and the constraints between them. The variables of each
+        component are in the given order.
+        ([str], [((str), frozenset([(str)]))]) -> [([str], [((str), frozenset([(str)]))])]
+    """
+    root = dict([(var, var) for var in variables])
+
+    def find(var):
+        while root[var] != var:
+            root[var] = root[root[var]]
+            var = root[var]
+        return var
+
+    for scope, _ in constraints:
+        first = find(scope[0])
+        for var in scope[1:]:
+            root[find(var)] = first
+
+    groups = {}
+    for var in variables:
+        groups.setdefault(find(var), ([], []))[0].append(var)
+    for scope, tuples in constraints:
+        groups[find(scope[0])][1].append((scope, tuples))
+    return list(groups.values())
+
+
+class ModelCounter:
+    """ A #CSP counter over fixed domains that caches the tallies of the
+        components it counts, so that several queries on the same CSP (for
+        instance, one per value of a variable of interest) share their work.
+
+        counted is the list of values to tally, and caps the largest tally
+        of each that is kept (None for no cap). hits and misses count the
+        lookups in the cache.
+    """
+
+    def __init__(self, counted=(), caps=None):
+        self.counted = tuple(counted)
+        if caps is None:
+            caps = [None] * len(self.counted)
+        self.caps = tuple([sys.maxsize if cap is None else cap for cap in caps])
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, domains, constraints):
+        """ Return the tally of the solutions of the CSP with the given
+            domains and table constraints. The tables may only mention
+            variables of domains.
+            (ModelCounter, {str : set([str])}, [((str), set([(str)]))]) -> {(int) : int}
+        """
+        tables = []
+        for scope, tuples in constraints:
+            scope = tuple(scope)
+            tuples = frozenset([tuple(tup) for tup in tuples
+                                if all([val in domains[var] for var, val in zip(scope, tup)])])
+            if not tuples:
+                return {}
+            if scope:
+                tables.append((scope, tuples))
+        tally = {(0,) * len(self.counted): 1}
+        for variables, tables in components(list(domains), tables):
+            sub_domains = dict([(var, frozenset(domains[var])) for var in variables])
+            tally = _tally_product(tally, self._count_component(sub_domains, tables), self.caps)
+            if not tally:
+                break
+        return tally
+
+    def _count_component(self, domains, constraints):
+        """ Return the tally of one connected component, from the cache if
+            it has been counted before.
+            (ModelCounter, {str : frozenset([str])}, [((str), frozenset([(str)]))]) -> {(int) : int}
+        """
+        signature = (frozenset(domains.items()), frozenset(constraints))
+        tally = self.cache.get(signature)
+        if tally is not None:
+            self.hits += 1
+            return tally
+        self.misses += 1
+
+        # Branch on the variable in the most constraints, which is the most
+        # likely to split the component
+        degree = dict([(var, 0) for var in domains])
+        for scope, _ in constraints:
+            for var in scope:
+                degree[var] += 1
+        var = max(domains, key=lambda x: degree[x])
+        others = [ovar for ovar in domains if ovar != var]
+
+        tally = {}
+        for val in sorted(domains[var]):
+            residual = restrict(constraints, var, val)
+            if residual is None:
+                continue
+            key = tuple([int(val == cval) for cval in self.counted])
+            if any([k > cap for k, cap in zip(key, self.caps)]):
+                continue
+            branch = {key: 1}
+            for variables, tables in components(others, residual):
+                sub_domains = dict([(ovar, domains[ovar]) for ovar in variables])
+                branch = _tally_product(branch, self._count_component(sub_domains, tables), self.caps)
+                if not branch:
+                    break
+            for key, n in branch.items():
+                tally[key] = tally.get(key, 0) + n
+
+        self.cache[signature] = tally
+        return tally
@@ -59,71 +59,157 @@ def modify_tuple(ori_tuple: tuple, offsets: list):
     return tuple(temp)
     
     
-def main():
-    args                   = process_command_line_arguments()
-    input_path             = args.input
-    output_path            = args.output
-    variables, constraints = parse_nary_file(input_path)
+def tuple_name(values: tuple) -> str:
+    """Return the name of a union variable or of one of its values, which is
+    the tuple of its variables or of their values joined by commas, e.g.
+    ('S', 'P') -> 'S,P'. It contains no whitespace, so it can be written to a
+    CSP file, and unlike a plain concatenation two different tuples of names
+    without commas cannot get the same name.
+    """
+    return ",".join(values)
 
-    # unary_cons = list(filter(lambda x: len(x[0]) == 1, constraints))
-    # if len(unary_cons) != 0:
-    #     for unary_var, unary_domain in unary_cons:
-    #         variables[unary_var] = variables[unary_var].intersection(set(unary_domain))
-    
-    
-    bin_variables   = variables # This is the new binary variables dictionary inclued the union variables -> (x,y,z) : set((1,2,3),(3,4,5)...)
+
+def binarise(variables, constraints):
+    """Compile an n-ary CSP into a binary one. Each set of variables in a
+    constraint of more than two variables becomes a union variable, whose
+    values are the tuples allowed by all of those constraints, and which is
+    linked to each of its variables by a binary constraint. The unary
+    constraints restrict the domains instead.
+
+        Parameters
+        ----------
+        variables : Dict[str, Set[str]]
+            The domains of the variables, as returned by parse_nary_file. It is
+            not modified.
+
+        constraints : List[Tuple[Tuple[str, ...], List[Tuple[str, ...]]]]
+            The constraints, as returned by parse_nary_file.
+
+        Returns
+        -------
+        None if the constraints are found to be unsatisfiable, otherwise
+
+        bin_variables : Dict[str, Set[str]]
+            The domains of the variables and the union variables.
+
+        bin_constraints : List[Tuple[Tuple[str, str], List[Tuple[str, str]]]]
+            The binary constraints.
+
+    """
+    bin_variables   = dict([(var, set(domain)) for var, domain in variables.items()]) # This is the new binary variables dictionary inclued the union variables -> (x,y,z) : set((1,2,3),(3,4,5)...)
     bin_constraints = []        # This is the new binary constraints list inclued the union variables -> [ ( (x,y,z),[(1,1,2),(2,2,3)...] ), ]
     union_var_dict  = {}        # a dictionry to check whether there is a duplicated union variable constraint -> (x,y,z) : set(x,y,z)
     bin_var_dict    = {}        # a dictionry to check whether there is a duplicated binary variable constraint -> {(x,y) : set((1,1),(2,4)...)}
     
     for cons_vars, cons_valid_list in constraints:
+        cons_vars = tuple(cons_vars)
         if len(cons_vars) > 2:
             if set(cons_vars) not in union_var_dict.values():
-                bin_variables[cons_vars]  = set(cons_valid_list) 
+                bin_variables[cons_vars]  = set([tuple(x) for x in cons_valid_list])
                 union_var_dict[cons_vars] = set(cons_vars)
     
             else:
                 if cons_vars in union_var_dict:
-                    bin_variables[cons_vars] = bin_variables[cons_vars].intersection(set(cons_valid_list))
+                    bin_variables[cons_vars] = bin_variables[cons_vars].intersection(set([tuple(x) for x in cons_valid_list]))
                     if len(bin_variables[cons_vars]) == 0:
-                        print("Unsatisfiable constraints")
                         return None
                 else:
                     var_key                  = list(union_var_dict.keys())[list(union_var_dict.values()).index(set(cons_vars))]
-                    var_offsets              = [var_key.index(cons_vars[i]) - i for i in range(len(cons_vars))]
+                    var_offsets              = [cons_vars.index(var_key[i]) - i for i in range(len(cons_vars))] # position i of var_key comes from cons_vars
                     
                     revised_valid_list       = set(map(lambda x :modify_tuple(x, var_offsets), cons_valid_list))
                     
                     bin_variables[var_key]   = bin_variables[var_key].intersection(revised_valid_list)
                     if len(bin_variables[var_key]) == 0:
-                        print("Unsatisfiable constraints")
                         return None
-                            
-        else:
+
+        elif len(cons_vars) == 2:
             b_x, b_y = cons_vars
-            if ((b_x,b_y) in bin_var_dict) or ((b_y,b_x) in bin_var_dict):
-                bin_var_dict[cons_vars] = bin_var_dict[cons_vars].intersection(set(cons_valid_list)) if (b_x, b_y) in bin_var_dict else bin_var_dict[cons_vars].intersection(set([(y,x) for x,y in cons_valid_list]))
-                if len(bin_var_dict[cons_vars]) == 0:
-                    print("Unsatisfiable constraints")
-                    return None
+            if (b_x, b_y) in bin_var_dict:
+                bin_var_dict[(b_x, b_y)] = bin_var_dict[(b_x, b_y)].intersection(set([tuple(x) for x in cons_valid_list]))
+            elif (b_y, b_x) in bin_var_dict:
+                bin_var_dict[(b_y, b_x)] = bin_var_dict[(b_y, b_x)].intersection(set([(y, x) for x, y in cons_valid_list]))
             else:
-                bin_var_dict[cons_vars] = set(cons_valid_list)
+                bin_var_dict[(b_x, b_y)] = set([tuple(x) for x in cons_valid_list])
+            if len(bin_var_dict.get((b_x, b_y), bin_var_dict.get((b_y, b_x)))) == 0:
+                return None
+
+        elif len(cons_vars) == 1:
+            # a unary constraint only restricts the domain of its variable
+            u_var = cons_vars[0]
+            bin_variables[u_var] = bin_variables[u_var].intersection(set([x[0] for x in cons_valid_list]))
+            if len(bin_variables[u_var]) == 0:
+                return None
+
+        elif len(cons_valid_list) == 0:
+            # a constraint over no variable is either always or never satisfied
+            return None
             
     for x_y, bin_domain in bin_var_dict.items():
-        bin_constraints.append((x_y, list(bin_var_dict)))
+        bin_constraints.append((x_y, list(bin_domain)))
         
     for u_vars in union_var_dict.keys():
+        u_name   = tuple_name(u_vars)
+        u_domain = bin_variables.pop(u_vars)
+        bin_variables[u_name] = set([tuple_name(x) for x in u_domain])
         for o_index, o_var in enumerate(u_vars):
             o_domain = bin_variables[o_var]
             bin_constraints.append((
-                                    (o_var, "".join(u_vars)),
-                                    [(x[o_index], str(x)) for x in bin_variables[u_vars] if x[o_index] in o_domain]
+                                    (o_var, u_name),
+                                    [(x[o_index], tuple_name(x)) for x in u_domain if x[o_index] in o_domain]
                                    ))
+
+    return bin_variables, bin_constraints
+
+
+def to_csp(bin_variables, bin_constraints, csp=None):
+    """Build a CSP object from a binary CSP returned by binarise, without
+    writing it to a file. The values of each domain are sorted, so that the
+    CSP does not depend on the iteration order of the sets.
+
+        Parameters
+        ----------
+        bin_variables : Dict[str, Set[str]]
+            The domains of the variables.
+
+        bin_constraints : List[Tuple[Tuple[str, str], List[Tuple[str, str]]]]
+            The binary constraints.
+
+        csp : csp.CSP, optional
+            The empty CSP to fill in, a new csp.CSP by default.
+
+        Returns
+        -------
+        csp : csp.CSP
+
+    """
+    if csp is None:
+        from csp import CSP
+        csp = CSP()
+    for bin_var, bin_domain in bin_variables.items():
+        csp.add_variables([bin_var], sorted(bin_domain))
+    for (var0, var1), cons_valid_list in bin_constraints:
+        csp.add_constraint(var0, var1, cons_valid_list)
+    return csp
+
+
+def main():
+    args                   = process_command_line_arguments()
+    input_path             = args.input
+    output_path            = args.output
+    variables, constraints = parse_nary_file(input_path)
+
+    binary = binarise(variables, constraints)
+    if binary is None:
+        print("Unsatisfiable constraints")
+        return None
+    bin_variables, bin_constraints = binary
             
     with open(output_path, "w") as file:
         for bin_var, bin_domain in bin_variables.items():
-            file.write("var " + "".join(bin_var) + " : " +  " ".join([str(x) for x in bin_domain]) + "\n")
+            file.write("var " + bin_var + " : " +  " ".join([str(x) for x in bin_domain]) + "\n")
         for cons_vars, cons_valid_list in bin_constraints:
+            cons_valid_list = list(cons_valid_list)
             cons_valid_list[0] = " ".join(cons_valid_list[0])
             if len(cons_valid_list) == 1:
                 file.write("con " + " ".join(cons_vars) + " : " + cons_valid_list[0] + "\n")
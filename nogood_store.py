@@ -0,0 +1,143 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements a bounded store of nogoods for backtracking search.
+
+    A nogood is a partial assignment, a set of (variable, value) literals,
+    that cannot be extended to a solution. With conflict-directed backjumping,
+    every dead end gives one for free: the decisions in the conflict set of the
+    variable that ran out of values. Recording them lets the search reject a
+    value as soon as all the other literals of a nogood containing it hold,
+    instead of rediscovering the same dead end in another branch.
+
+    Nogoods are checked with two watched literals, as in SAT solvers: each
+    nogood watches two of its literals, and only the nogoods watching a literal
+    are visited when it becomes true. When a nogood cannot find a replacement
+    for a watch, all its literals but one hold, and that last one is recorded
+    as forbidden. Watches do not need to change when the search backtracks,
+    forbidden literals are checked again against the current assignment
+    before being used.
+
+    The store keeps at most `capacity` nogoods and evicts the least recently
+    used one, so memory stays bounded on long runs.
+"""
+
+from collections import OrderedDict
+
+
+class NogoodStore:
+    """ A size-bounded set of nogoods with least recently used eviction.
+
+        The counters learned, hits and evictions are the number of nogoods
+        recorded, of values rejected by a nogood, and of nogoods evicted.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Error: the nogood store needs a capacity of at least 1")
+        self.capacity = capacity
+
+        # Nogood id -> tuple of (var, val) literals, in least recently used order
+        self.nogoods = OrderedDict()
+
+        # Nogood id -> the two literals it watches (the same one twice for a
+        # nogood of size 1), and literal -> ids of the nogoods watching it
+        self.watched = {}
+        self.watches = {}
+
+        # Literal -> id of a nogood whose other literals all held when it was
+        # recorded. It may be out of date after backtracking.
+        self.forbidden = {}
+
+        self.next_id = 0
+        self.learned = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, literals, assignment):
+        """ Record a nogood. Its literals are in the order of the decisions, so
+            the last one is the most recent. It watches its two most recent
+            literals. If all its literals but one hold, that one is forbidden,
+            and if they all hold, as when the search records a dead end just
+            before undoing its latest decision, the last one is.
+            (NogoodStore, [(str, str)], {str : str}) -> None
+        """
+        nogood = tuple(literals)
+        ng_id = self.next_id
+        self.next_id += 1
+        self.nogoods[ng_id] = nogood
+        self.learned += 1
+
+        first, second = nogood[-1], nogood[-2] if len(nogood) > 1 else nogood[-1]
+        self.watched[ng_id] = (first, second)
+        self.watches.setdefault(first, set()).add(ng_id)
+        self.watches.setdefault(second, set()).add(ng_id)
+
+        unset = [(var, val) for var, val in nogood if assignment.get(var) != val]
+        if not unset:
+            self.forbidden[nogood[-1]] = ng_id
+        elif len(unset) == 1:
+            self.forbidden[unset[0]] = ng_id
+
+        if len(self.nogoods) > self.capacity:
+            self.evict()
+
+    def evict(self):
+        """ Remove the least recently used nogood.
+            (NogoodStore) -> None
+        """
+        ng_id, _ = self.nogoods.popitem(last=False)
+        for literal in self.watched.pop(ng_id):
+            watchers = self.watches.get(literal)
+            if watchers is not None:
+                watchers.discard(ng_id)
+                if not watchers:
+                    del self.watches[literal]
+        self.evictions += 1
+
+    def check(self, var, val, assignment):
+        """ Return a nogood violated by also assigning val to var, or None.
+            (NogoodStore, str, str, {str : str}) -> tuple or None
+        """
+        ng_id = self.forbidden.get((var, val))
+        if ng_id is None:
+            return None
+        nogood = self.nogoods.get(ng_id)
+        if nogood is None or any([assignment.get(ovar) != oval
+                                  for ovar, oval in nogood if ovar != var]):
+            del self.forbidden[(var, val)]
+            return None
+        self.nogoods.move_to_end(ng_id)
+        self.hits += 1
+        return nogood
+
+    def on_assign(self, var, val, assignment):
+        """ Update the watches of the nogoods watching the literal (var, val),
+            which has just become true.
+            (NogoodStore, str, str, {str : str}) -> None
+        """
+        literal = (var, val)
+        watchers = self.watches.get(literal)
+        if not watchers:
+            return
+        for ng_id in list(watchers):
+            first, second = self.watched[ng_id]
+            other = second if first == literal else first
+            for candidate in self.nogoods[ng_id]:
+                if candidate != literal and candidate != other and \
+                        assignment.get(candidate[0]) != candidate[1]:
+                    watchers.discard(ng_id)
+                    self.watches.setdefault(candidate, set()).add(ng_id)
+                    self.watched[ng_id] = (candidate, other)
+                    break
+            else:
+                # Every literal but the other watched one holds
+                if assignment.get(other[0]) != other[1]:
+                    self.forbidden[other] = ng_id
+        if not watchers:
+            del self.watches[literal]
@@ -0,0 +1,142 @@
+"""NumPy-vectorised arc consistency.
+
+COMP3620/6320 Artificial Intelligence
+The Australian National University
+Authors: COMP-3620 team
+Date:    2021
+
+Each binary constraint is stored as a boolean support matrix M, where M[a, b]
+is True when value a of X_i and value b of X_j are compatible. Revising the
+arc (X_i, X_j) is then a single masked reduction, M[:, dom_j].any(axis=1),
+instead of a double loop over the two domains. This pays off on problems with
+large domains, such as the hidden variables of binarised n-ary CSPs, which
+can have hundreds of tuple values.
+
+NumPy is an optional dependency: this module can always be imported, but
+calling the inference function without NumPy installed raises an ImportError.
+"""
+
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from csp import CSP
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Assignment = Dict[str, str]
+Pruned = List[Tuple[str, str]]
+
+
+def require_numpy() -> None:
+    """Raise an ImportError if NumPy is not installed."""
+    if np is None:
+        raise ImportError("The NumPy arc consistency engine requires numpy")
+
+
+class SupportMatrices:
+    """The support matrices of all the arcs of a CSP.
+
+    Values are indexed by their position in `gamma.domains[var]`, which does
+    not change during search.
+    """
+
+    def __init__(self, gamma: CSP):
+        require_numpy()
+        self.values = dict([(var, list(gamma.domains[var])) for var in gamma.variables])
+        self.index = dict([(var, dict([(val, i) for i, val in enumerate(values)]))
+                           for var, values in self.values.items()])
+        self.matrices: Dict[Tuple[str, str], "np.ndarray"] = {}
+        for X_i in gamma.variables:
+            for X_j in gamma.neighbours[X_i]:
+                self.matrices[(X_i, X_j)] = self._build(gamma, X_i, X_j)
+
+    def _build(self, gamma: CSP, X_i: str, X_j: str):
+        """Build the support matrix of the arc (X_i, X_j)."""
+        matrix = np.ones((len(self.values[X_i]), len(self.values[X_j])), dtype=bool)
+        index_j = self.index[X_j]
+        for a, Xi_val in enumerate(self.values[X_i]):
+            for Xj_val in gamma.conflicts[(X_i, Xi_val)][X_j]:
+                if Xj_val in index_j:
+                    matrix[a, index_j[Xj_val]] = False
+        return matrix
+
+    def domain_vector(self, gamma: CSP, var: str):
+        """Return the current domain of var as a boolean vector."""
+        vector = np.zeros(len(self.values[var]), dtype=bool)
+        index = self.index[var]
+        for val in gamma.current_domains[var]:
+            vector[index[val]] = True
+        return vector
+
+
+# The matrices are built once per CSP, the first time they are needed.
+_support_matrices: "weakref.WeakKeyDictionary[CSP, SupportMatrices]" = weakref.WeakKeyDictionary()
+
+
+def get_support_matrices(gamma: CSP) -> SupportMatrices:
+    """Return the support matrices of the CSP, building them if necessary."""
+    matrices = _support_matrices.get(gamma)
+    if matrices is None:
+        matrices = SupportMatrices(gamma)
+        _support_matrices[gamma] = matrices
+    return matrices
+
+
+def arc_consistency_numpy(var: Optional[str], assignment: Assignment, gamma: CSP) -> Optional[Pruned]:
+    """AC-3 with each revision done as one NumPy reduction.
+
+        Parameters
+        ----------
+        var : Optional[str]
+            The name of the variable which has just been assigned, or None when
+            AC-3 is used for preprocessing.
+        assignment : Dict[str, str]
+            A Python dictionary of the current assignment. It is not changed.
+        gamma : CSP
+            The constraint network. It is not changed.
+
+        Returns
+        -------
+        pruned_list : Optional[Pruned]
+            None if a domain is wiped out, otherwise the list of (variable,
+            value) pairs to prune, exactly as `inference.arc_consistency`.
+    """
+    support = get_support_matrices(gamma)
+    matrices = support.matrices
+    domains = {}
+
+    def domain(x):
+        vector = domains.get(x)
+        if vector is None:
+            vector = domains[x] = support.domain_vector(gamma, x)
+        return vector
+
+    if var is None:
+        M = set([(x, y) for x in gamma.variables for y in gamma.neighbours[x]])
+    else:
+        M = set([(y, var) for y in gamma.neighbours[var]])
+
+    initial = {}
+    while M:
+        X_i, X_j = M.pop()
+        dom_i = domain(X_i)
+        revised = dom_i & matrices[(X_i, X_j)][:, domain(X_j)].any(axis=1)
+        if not revised.any():
+            gamma.increase_conflict_weight(X_i, X_j)
+            return None
+        if not np.array_equal(revised, dom_i):
+            initial.setdefault(X_i, dom_i)
+            domains[X_i] = revised
+            for X_k in gamma.neighbours[X_i]:
+                if X_k != X_j:
+                    M.add((X_k, X_i))
+
+    pruned_list = []
+    for x, dom_x in initial.items():
+        values = support.values[x]
+        for i in np.flatnonzero(dom_x & ~domains[x]):
+            pruned_list.append((x, values[i]))
+    return pruned_list
@@ -0,0 +1,367 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements a parallel portfolio of backtracking searches.
+
+    The running time of a configuration of the solver (variable and value
+    heuristics, inference, backjumping, restarts, ...) can differ by orders
+    of magnitude from one instance to the next, and there is no way to tell
+    in advance which one will be fast. A portfolio runs several of them at the
+    same time, in separate processes, on the same parsed CSP, and takes the
+    answer of the first to finish. Since every configuration is complete, the
+    first answer, SAT or UNSAT, is the answer. The other processes are then
+    terminated.
+
+    Cube-and-conquer splits the search of one configuration instead. The
+    first decisions of the search are enumerated into cubes, partial
+    assignments which are consistent after inference, and a pool of
+    processes searches below each cube independently. The CSP is satisfiable
+    if and only if one of the cubes can be extended to a solution. The pool
+    has no work stealing: the tree is split into many more cubes than there
+    are workers, so that a worker whose cube was exhausted early just takes
+    the next one, and the load stays balanced.
+"""
+
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+from collections import namedtuple
+
+import backtracking_search
+import bitset_csp
+from heuristics import (get_value_ordering_function,
+                        get_variable_selection_function, phase_saving)
+from inference import get_inference_function
+from nogood_store import NogoodStore
+from restarts import get_restart_schedule
+
+Configuration = namedtuple("Configuration",
+                           ["variable_heuristic", "value_heuristic", "inference",
+                            "backjumping", "nogoods", "restarts", "phase_saving"],
+                           defaults=[False, 0, "none", False])
+Configuration.__doc__ = """ A configuration of the backtracking search. nogoods is the
+    capacity of the nogood store (0 for none) and restarts the name of a
+    restart strategy (see restarts.py). """
+
+# The configurations given to the workers after the first one, which runs
+# the configuration from the command line. They are chosen to be different
+# from each other. With more workers than configurations, they are used
+# again with restarts, so that their random seeds make a difference.
+PORTFOLIO = [
+    Configuration("dom-wdeg", "lex", "forward", restarts="luby", phase_saving=True),
+    Configuration("mrv", "lex", "forward", nogoods=10000, restarts="geometric", phase_saving=True),
+    Configuration("mrv", "lcvf", "arc"),
+    Configuration("dom-ddeg", "lex", "forward", backjumping=True),
+    Configuration("md-mrv", "lex", "forward", nogoods=10000),
+    Configuration("dom-wdeg", "lex", "arc-rm"),
+    Configuration("mrv-md", "lcvf", "forward", restarts="luby"),
+]
+
+# The number of seconds the portfolio waits for a result before checking
+# whether a worker died without reporting one
+WORKER_POLL_INTERVAL = 0.5
+
+
+def describe(config):
+    """ Return the command line options of solver.py for the configuration.
+        (Configuration) -> str
+    """
+    options = ["-v", config.variable_heuristic, "-l", config.value_heuristic]
+    if config.inference is not None:
+        options += ["-i", config.inference]
+    if config.backjumping:
+        options.append("-j")
+    if config.nogoods:
+        options += ["-g", str(config.nogoods)]
+    if config.restarts != "none":
+        options += ["-r", config.restarts]
+    if config.phase_saving:
+        options.append("-P")
+    return " ".join(options)
+
+
+def portfolio_configurations(first, n_workers):
+    """ Return the configurations of the n workers, starting with first.
+        (Configuration, int) -> [Configuration]
+    """
+    configs = [first]
+    for i in range(1, n_workers):
+        config = PORTFOLIO[(i - 1) % len(PORTFOLIO)]
+        if i > len(PORTFOLIO) and config.restarts == "none":
+            config = config._replace(restarts="luby", phase_saving=True)
+        configs.append(config)
+    return configs
+
+
+def configuration_inference(csp, config):
+    """ Return the name of the inference used by the configuration on the CSP,
+        and the inference function for its representation.
+        (CSP, Configuration) -> (str, function)
+    """
+    inference = config.inference
+    if csp.alldiffs:
+        # Only alldiff propagation prunes with the native alldiff constraints
+        inference = "alldiff"
+    if isinstance(csp, bitset_csp.BitsetCSP):
+        return inference, bitset_csp.get_inference_function(inference)
+    return inference, get_inference_function(inference)
+
+
+def run_configuration(csp, initial_assignment, config, restart_unit=100):
+    """ Run backtracking search on the CSP with the given configuration.
+        (CSP, {str : str}, Configuration, int) -> ({str : str}, int, float)
+    """
+    inference, inference_function = configuration_inference(csp, config)
+    value_ordering_function = get_value_ordering_function(config.value_heuristic)
+    if config.phase_saving:
+        value_ordering_function = phase_saving(value_ordering_function)
+    nogoods = NogoodStore(config.nogoods) if config.nogoods else None
+    return backtracking_search.search(csp, initial_assignment,
+                                      get_variable_selection_function(config.variable_heuristic),
+                                      value_ordering_function, inference_function,
+                                      config.backjumping, inference in (None, "forward"), nogoods,
+                                      get_restart_schedule(config.restarts, restart_unit))
+
+
+def _worker(index, csp, initial_assignment, config, restart_unit, seed, results):
+    """ The body of a worker process: solve the CSP quietly and put
+        (index, status, assignment, nodes expanded) in the results queue.
+    """
+    sys.stdout = open(os.devnull, "w")
+    random.seed(seed)
+    try:
+        assignment, explored, _ = run_configuration(csp, initial_assignment, config, restart_unit)
+    except Exception as e:
+        results.put((index, "ERROR", str(e), 0))
+        return
+    results.put((index, "UNSAT" if assignment is None else "SAT", assignment, explored))
+
+
+def portfolio_search(csp, initial_assignment, first, n_workers, seed, restart_unit=100):
+    """ Solve the CSP with a portfolio of n_workers processes, the first one
+        running the configuration first. The worker i uses the random seed
+        seed + i. The restarts of all the workers use restart_unit.
+
+        Return the assignment found as a solution (or None if the CSP is
+        unsatisfiable), the number of nodes expanded by the winning worker,
+        the wall-clock time and the configuration of the winning worker.
+
+        (CSP, {str : str}, Configuration, int, int, int) -> ({str : str}, int, float, Configuration)
+    """
+    if n_workers < 1:
+        raise ValueError("Error: the portfolio needs at least one worker")
+    start_time = time.time()
+    configs = portfolio_configurations(first, n_workers)
+    if csp.alldiffs:
+        configs = [config._replace(inference="alldiff") for config in configs]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, daemon=True,
+                                       args=(i, csp, initial_assignment, config, restart_unit,
+                                             seed + i, results))
+               for i, config in enumerate(configs)]
+    try:
+        for worker in workers:
+            worker.start()
+        errors = []
+        reported = set()
+        # The workers found dead at the last check. One that has still not
+        # reported after the next wait was killed, or crashed outside of
+        # Python, since a worker puts its result before it exits
+        dead = set()
+        while True:
+            try:
+                index, status, assignment, explored = results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                for index in sorted(dead - reported):
+                    reported.add(index)
+                    errors.append("worker {} ({}): died with exit code {}".format(
+                        index, describe(configs[index]), workers[index].exitcode))
+                dead = set([i for i, worker in enumerate(workers) if not worker.is_alive()])
+            else:
+                reported.add(index)
+                if status != "ERROR":
+                    break
+                errors.append("worker {} ({}): {}".format(index, describe(configs[index]), assignment))
+            if len(errors) == n_workers:
+                raise ValueError("Error: every worker of the portfolio failed:\n" + "\n".join(errors))
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+    return assignment, explored, time.time() - start_time, configs[index]
+
+
+def pool_results(n_workers, initializer, initargs, function, tasks, name):
+    """ Yield the result of function on each task, in the order they are
+        finished by a pool of n_workers processes set up by
+        initializer(*initargs). A failed task raises a ValueError naming the
+        pool.
+
+        Closing the generator terminates the pool, which stops the tasks still
+        running, so the caller should close it when it stops early.
+        (int, function, tuple, function, [object], str) -> generator
+    """
+    with multiprocessing.Pool(n_workers, initializer, initargs) as pool:
+        results = pool.imap_unordered(function, tasks)
+        while True:
+            try:
+                result = next(results)
+            except StopIteration:
+                return
+            except Exception as e:
+                raise ValueError("Error: a {} worker failed: {}".format(name, e))
+            yield result
+
+
+# The number of cubes per worker aimed at by cube-and-conquer
+CUBES_PER_WORKER = 8
+
+
+def apply_cube(csp, assignment, cube, inference):
+    """ Make the decisions of the cube, with inference after each of them, as
+        the backtracking search would. Return False, with nothing changed, if
+        a decision conflicts.
+        (CSP, {str : str}, [(str, str)], function) -> bool
+    """
+    for n_made, (var, val) in enumerate(cube):
+        pruned_list = None
+        if not csp.count_conflicts(var, val):
+            csp.make_assignment(var, val)
+            assignment[var] = val
+            pruned_list = inference(var, assignment, csp)
+            if pruned_list is None:
+                csp.clear_assignment(var, assignment)
+        if pruned_list is None:
+            undo_cube(csp, assignment, cube[:n_made])
+            return False
+        csp.notify_of_inference(var, assignment, pruned_list)
+    return True
+
+
+def undo_cube(csp, assignment, cube):
+    """ Undo the decisions of a cube made by apply_cube.
+        (CSP, {str : str}, [(str, str)]) -> None
+    """
+    for var, _ in reversed(cube):
+        csp.clear_assignment(var, assignment)
+
+
+def generate_cubes(csp, initial_assignment, config, n_cubes, max_depth):
+    """ Split the search of the configuration into at least n_cubes cubes,
+        each one a list of (var, val) decisions, unless they have been split
+        max_depth times. The cubes are extended one decision at a time, with
+        the variable and the value ordering of the configuration, and the
+        values that fail are dropped, so the cubes are in the order the
+        search would visit them. The decisions with only one value left, as
+        are common with strong inference, do not count as splits.
+
+        Return the cubes, a solution if one was found while splitting (then
+        there are no cubes), and the number of nodes expanded. If there is
+        neither a cube nor a solution, the CSP is unsatisfiable.
+
+        (CSP, {str : str}, Configuration, int, int) -> ([[(str, str)]], {str : str}, int)
+    """
+    select = get_variable_selection_function(config.variable_heuristic)
+    order = get_value_ordering_function(config.value_heuristic)
+    _, inference = configuration_inference(csp, config)
+    assignment = dict(initial_assignment)
+    cubes = [[]]
+    n_expanded_nodes = 0
+    depth = 0
+    while depth < max_depth and len(cubes) < n_cubes:
+        next_cubes = []
+        split = False
+        for cube in cubes:
+            apply_cube(csp, assignment, cube, inference)
+            var = select(assignment, csp)
+            if var is None:
+                solution = dict(assignment)
+                undo_cube(csp, assignment, cube)
+                return [], solution, n_expanded_nodes
+            n_children = 0
+            for val in order(var, assignment, csp):
+                n_expanded_nodes += 1
+                if apply_cube(csp, assignment, [(var, val)], inference):
+                    next_cubes.append(cube + [(var, val)])
+                    undo_cube(csp, assignment, [(var, val)])
+                    n_children += 1
+            split = split or n_children > 1
+            undo_cube(csp, assignment, cube)
+        cubes = next_cubes
+        depth += split
+        if not cubes:
+            break
+    return cubes, None, n_expanded_nodes
+
+
+# The CSP, initial assignment, configuration, restart unit and random seed
+# of a cube-and-conquer worker process, set once when the process starts
+_cube_problem = None
+
+
+def _init_cube_worker(csp, initial_assignment, config, restart_unit, seed):
+    """Set up a cube-and-conquer worker process."""
+    global _cube_problem
+    sys.stdout = open(os.devnull, "w")
+    _cube_problem = (csp, initial_assignment, config, restart_unit, seed)
+
+
+def _solve_cube(task):
+    """ Search below the cube of the task (index, cube) in a worker process,
+        and return (index, assignment or None, nodes expanded). The decisions
+        of the cube are undone afterwards, so the process can take the next
+        one.
+    """
+    index, cube = task
+    csp, initial_assignment, config, restart_unit, seed = _cube_problem
+    random.seed(seed + index)
+    _, inference = configuration_inference(csp, config)
+    assignment = dict(initial_assignment)
+    if not apply_cube(csp, assignment, cube, inference):
+        return index, None, 0
+    solution, explored, _ = run_configuration(csp, assignment, config, restart_unit)
+    if solution is None:
+        undo_cube(csp, assignment, cube)
+    return index, solution, explored
+
+
+def cube_and_conquer(csp, initial_assignment, config, n_workers, seed,
+                     max_depth=10, restart_unit=100):
+    """ Solve the CSP by splitting the search of the configuration into cubes
+        split at most max_depth times (see generate_cubes), searched by a pool of n_workers
+        processes. The cube i uses the random seed seed + i.
+
+        Return the assignment found as a solution (or None if the CSP is
+        unsatisfiable), the total number of nodes expanded, the wall-clock
+        time and the number of cubes.
+
+        (CSP, {str : str}, Configuration, int, int, int, int) -> ({str : str}, int, float, int)
+    """
+    if n_workers < 1:
+        raise ValueError("Error: cube-and-conquer needs at least one worker")
+    if max_depth < 1:
+        raise ValueError("Error: the cubes need a depth of at least 1")
+    start_time = time.time()
+    cubes, solution, explored = generate_cubes(csp, initial_assignment, config,
+                                               n_workers * CUBES_PER_WORKER, max_depth)
+    if not cubes:
+        return solution, explored, time.time() - start_time, 0
+
+    results = pool_results(n_workers, _init_cube_worker,
+                           (csp, initial_assignment, config, restart_unit, seed),
+                           _solve_cube, list(enumerate(cubes)), "cube-and-conquer")
+    try:
+        for _, solution, cube_explored in results:
+            explored += cube_explored
+            if solution is not None:
+                break
+    finally:
+        results.close()
+    return solution, explored, time.time() - start_time, len(cubes)
@@ -0,0 +1,67 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file contains the restart schedules of the backtracking search.
+
+    A schedule is an iterator over the number of nodes the search may expand
+    before each restart. Both schedules grow without bound, so a search with
+    restarts stays complete.
+
+    luby:      unit * (1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...),
+               the universal schedule of Luby, Sinclair and Zuckerman, which
+               is within a log factor of the best fixed cutoff.
+    geometric: unit, unit * factor, unit * factor^2, ...
+"""
+
+import itertools
+from typing import Iterator, Optional
+
+
+def luby(i: int) -> int:
+    """ Return the i-th term (from 1) of the Luby sequence.
+        (int) -> int
+    """
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+def luby_schedule(unit: int) -> Iterator[int]:
+    """ Return the Luby sequence of cutoffs, scaled by unit.
+        (int) -> iterator of int
+    """
+    for i in itertools.count(1):
+        yield unit * luby(i)
+
+
+def geometric_schedule(unit: int, factor: float = 1.5) -> Iterator[int]:
+    """ Return the cutoffs unit, unit * factor, unit * factor^2, ...
+        (int, float) -> iterator of int
+    """
+    cutoff = float(unit)
+    while True:
+        yield int(cutoff)
+        cutoff *= factor
+
+
+def get_restart_schedule(restart_strategy: Optional[str], unit: int) -> Optional[Iterator[int]]:
+    """Return the appropriate restart schedule, or None for no restarts."""
+    if restart_strategy is None or restart_strategy == "none":
+        return None
+    if unit < 1:
+        raise ValueError("Error: the restart unit must be at least 1")
+    if restart_strategy == "luby":
+        return luby_schedule(unit)
+    if restart_strategy == "geometric":
+        return geometric_schedule(unit)
+
+    raise ValueError(f"Error: the restart strategy "
+                     f"'{restart_strategy}' is not supported")
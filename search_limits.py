@@ -0,0 +1,105 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements the node, time and memory limits of the backtracking
+    search.
+
+    When a limit is reached, the search stops without an answer, and the
+    reason and the deepest partial assignment it reached are kept here, so the
+    run still reports something useful. The node count is compared with the
+    next check point at every node, while the clock and the peak resident set
+    size (RSS) of the process are only read every check_interval nodes, so
+    the limits cost almost nothing.
+
+    The memory limit reads the peak RSS with the resource module, which is
+    only available on Unix. Without it, asking for a memory limit raises an
+    ImportError.
+"""
+
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """ Return the peak resident set size of the process in megabytes.
+        () -> float
+    """
+    if resource is None:
+        raise ImportError("The memory limit requires the resource module")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class SearchLimits:
+    """ The limits of one run of the backtracking search. Each limit is None
+        when it is not used.
+
+        max_nodes is the number of nodes that may be expanded, timeout the
+        number of seconds the search may take and max_rss the peak resident
+        set size in megabytes the process may reach. Once the search stops,
+        reason says which limit was reached (it is None if the search
+        finished) and deepest is the partial assignment with the most
+        variables that the search made.
+    """
+
+    def __init__(self, max_nodes=None, timeout=None, max_rss=None, check_interval=256):
+        if max_nodes is not None and max_nodes < 0:
+            raise ValueError("Error: the node limit cannot be negative")
+        if timeout is not None and timeout < 0:
+            raise ValueError("Error: the time limit cannot be negative")
+        if max_rss is not None:
+            peak_rss_mb()
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.check_interval = check_interval
+
+        self.start_time = time.time()
+        self.next_check = 0
+        self.reason = None
+        self.deepest = {}
+
+    def start(self):
+        """ Start the clock of the time limit and forget any earlier stop.
+            (SearchLimits) -> None
+        """
+        self.start_time = time.time()
+        self.next_check = 0
+        self.reason = None
+        self.deepest = {}
+
+    def exceeded(self, n_expanded_nodes):
+        """ Return True, and record the reason, if a limit has been reached
+            after expanding the given number of nodes. Otherwise, set the node
+            count of the next check.
+            (SearchLimits, int) -> bool
+        """
+        if self.max_nodes is not None and n_expanded_nodes >= self.max_nodes:
+            self.reason = "node limit of {} reached".format(self.max_nodes)
+        elif self.timeout is not None and time.time() - self.start_time >= self.timeout:
+            self.reason = "time limit of {} seconds reached".format(self.timeout)
+        elif self.max_rss is not None and peak_rss_mb() >= self.max_rss:
+            self.reason = "memory limit of {} MB reached".format(self.max_rss)
+        if self.reason is not None:
+            return True
+        self.next_check = n_expanded_nodes + self.check_interval
+        if self.max_nodes is not None:
+            self.next_check = min(self.next_check, self.max_nodes)
+        return False
+
+    def record(self, assignment):
+        """ Keep a copy of the assignment if it is the deepest one so far.
+            (SearchLimits, {str : str}) -> None
+        """
+        if len(assignment) > len(self.deepest):
+            self.deepest = dict(assignment)
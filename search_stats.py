@@ -0,0 +1,102 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements the statistics collected by the backtracking search
+    on request.
+
+    The search is split into phases: variable selection, value ordering,
+    conflict counting, nogood checks, assignment, inference, the update of the
+    domains after inference, and undo. When statistics are requested, the
+    search calls the function of each phase through a wrapper that adds up
+    its time and number of calls. Otherwise the functions are called
+    directly, so the only cost of the collector when it is disabled is a few
+    tests of `stats is not None` per backtrack.
+"""
+
+import json
+from time import perf_counter
+
+
+class SearchStats:
+    """ The statistics of one run of the backtracking search.
+
+        time and calls map each phase to its cumulative time in seconds and
+        its number of calls. inference_pruned is the total number of values
+        pruned by the successful calls to the inference function.
+        backtracks counts the variables that ran out of values, max_depth is
+        the largest number of decisions in progress at once and peak_trail
+        the largest size of the trail.
+    """
+
+    def __init__(self):
+        self.time = {}
+        self.calls = {}
+        self.inference_pruned = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.peak_trail = 0
+
+    def timed(self, phase, function):
+        """ Return function wrapped to add its time and calls to the phase.
+            (SearchStats, str, function) -> function
+        """
+        times = self.time
+        calls = self.calls
+        times.setdefault(phase, 0.0)
+        calls.setdefault(phase, 0)
+
+        def wrapper(*args):
+            start = perf_counter()
+            result = function(*args)
+            times[phase] += perf_counter() - start
+            calls[phase] += 1
+            return result
+
+        return wrapper
+
+    def timed_inference(self, function):
+        """ Return the inference function wrapped like timed("inference", ...),
+            also counting the values it prunes.
+            (SearchStats, function) -> function
+        """
+        timed_function = self.timed("inference", function)
+
+        def wrapper(var, assignment, csp):
+            pruned_list = timed_function(var, assignment, csp)
+            if pruned_list is not None:
+                self.inference_pruned += len(pruned_list)
+            return pruned_list
+
+        return wrapper
+
+    def on_decision(self, depth, trail_size):
+        """ Record the depth of the search and the size of the trail when a
+            new variable is pushed on the stack.
+            (SearchStats, int, int) -> None
+        """
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if trail_size > self.peak_trail:
+            self.peak_trail = trail_size
+
+    def as_dict(self):
+        """ Return the statistics as a dictionary of JSON-compatible values.
+            (SearchStats) -> dict
+        """
+        n_inferences = self.calls.get("inference", 0)
+        return {"time": dict(self.time),
+                "calls": dict(self.calls),
+                "total_time": sum(self.time.values()),
+                "inference_pruned": self.inference_pruned,
+                "pruned_per_inference": self.inference_pruned / n_inferences if n_inferences else 0.0,
+                "backtracks": self.backtracks,
+                "max_depth": self.max_depth,
+                "peak_trail": self.peak_trail}
+
+    def to_json(self):
+        """ Return the statistics as a single line of JSON.
+            (SearchStats) -> str
+        """
+        return json.dumps(self.as_dict(), sort_keys=True)
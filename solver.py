@@ -26,10 +26,12 @@ import os
 import random
 import sys
 
+import bitset_csp
 from csp import CSP
 from heuristics import (get_value_ordering_function,
-                        get_variable_selection_function)
+                        get_variable_selection_function, phase_saving)
 from inference import get_inference_function
+from restarts import get_restart_schedule
 
 try:
     val = int(os.environ['PYTHONHASHSEED'])
@@ -70,12 +72,13 @@ def parse_cmd_line_args() -> argparse.Namespace:
     parser.add_argument("-s", "--solution", dest="solution_file_name", metavar="SOLUTION",
                         help="If given, write the satisfying assignment to this file.")
     parser.add_argument("-S", "--search", dest="search_algorithm", metavar="SEARCH",
-                        choices=["backtracking", "local"], default="backtracking",
+                        choices=["backtracking", "local", "structured"], default="backtracking",
                         help="Choose a search algorithm from [%(choices)s] (default: %(default)s)")
     parser.add_argument("-R", "--seed", dest="rng_seed", metavar="RNG", type=int, default=8193,
                         help="Select a seed for the random number generator (default: %(default)s)")
     parser.add_argument("-v", "--var_heuristic", dest="variable_heuristic",
-                        choices=["lex", "md", "mrv", "md-mrv", "mrv-md"], default="lex",
+                        choices=["lex", "md", "mrv", "md-mrv", "mrv-md", "dom-wdeg", "dom-ddeg"],
+                        default="lex",
                         metavar="VAR", help="Choose a variable selection heuristic from " +
                         "[%(choices)s] (default: %(default)s)")
     parser.add_argument("-l", "--val_heuristic", dest="value_heuristic",
@@ -83,21 +86,104 @@ def parse_cmd_line_args() -> argparse.Namespace:
                         help="Choose a value selection heuristic from " +
                         "[%(choices)s] (default: %(default)s)")
     parser.add_argument("-p", "--preprocessing", dest="preprocessing",
-                        choices=["arc"], default=None,  metavar="PRE",
+                        choices=["arc", "arc-rm", "arc-np", "alldiff"], default=None,  metavar="PRE",
                         help="Choose an inference function to use as a preprocessing step before search:" +
                         "[%(choices)s]. If not given, no preprocessing is used.")
     parser.add_argument("-i", "--inference", dest="search_inference",
-                        choices=["forward", "arc"], default=None,  metavar="INF",
+                        choices=["forward", "arc", "arc-rm", "arc-np", "alldiff"], default=None,  metavar="INF",
                         help="Choose an inference function that runs during search: " +
                         "[%(choices)s]. If not given, no inference is used.")
+    parser.add_argument("-c", "--core", dest="core", metavar="CORE",
+                        choices=["set", "bitset"], default="set",
+                        help="Choose the internal representation of the CSP from [%(choices)s]: " +
+                        "sets of value names, or integer bitmasks (default: %(default)s)")
+    parser.add_argument("-a", "--alldiff", dest="alldiff", metavar="ALLDIFF",
+                        choices=["binary", "native"], default="binary",
+                        help="How alldiff constraints are handled, from [%(choices)s]: decomposed into " +
+                        "binary inequalities, or kept as global constraints for '-i alldiff' (default: %(default)s)")
+    parser.add_argument("-j", "--backjumping", dest="backjumping",
+                        action="store_true", default=False,
+                        help="Use conflict-directed backjumping instead of chronological backtracking.")
+    parser.add_argument("-g", "--nogoods", dest="nogood_capacity", type=int, default=0,
+                        metavar="CAPACITY", help="Record the dead ends of the search as nogoods, keeping at most " +
+                        "CAPACITY of them. This implies --backjumping (default: %(default)s, no nogoods)")
+    parser.add_argument("-r", "--restarts", dest="restart_strategy", metavar="RESTARTS",
+                        choices=["none", "luby", "geometric"], default="none",
+                        help="Choose a restart strategy for backtracking search from [%(choices)s]. Each restart " +
+                        "breaks the ties of the variable heuristic in a new random order (default: %(default)s)")
+    parser.add_argument("-u", "--restart_unit", dest="restart_unit", type=int, default=100,
+                        metavar="UNIT", help="The number of nodes of the first restarts (default: %(default)s)")
+    parser.add_argument("-P", "--phase_saving", dest="phase_saving",
+                        action="store_true", default=False,
+                        help="Try first the last value assigned to each variable.")
+    parser.add_argument("--stats", dest="stats", action="store_true", default=False,
+                        help="Record the time and calls of each phase of the backtracking search, and other " +
+                        "statistics, and write them as JSON after the result. Not available with -S local, " +
+                        "-S structured, --portfolio, --cubes or --components.")
+    parser.add_argument("--max-nodes", dest="max_nodes", type=int, default=None, metavar="NODES",
+                        help="Stop the backtracking search with an UNKNOWN answer after NODES nodes. Not available " +
+                        "with --portfolio, --cubes or --components.")
+    parser.add_argument("--timeout", dest="timeout", type=float, default=None, metavar="SECONDS",
+                        help="Stop the backtracking search with an UNKNOWN answer after SECONDS seconds. Not " +
+                        "available with --portfolio, --cubes or --components.")
+    parser.add_argument("--max-rss", dest="max_rss", type=float, default=None, metavar="MB",
+                        help="Stop the backtracking search with an UNKNOWN answer when the memory used by " +
+                        "the process (its peak resident set size) reaches MB megabytes. Not available with " +
+                        "--portfolio, --cubes or --components.")
+    parser.add_argument("-A", "--all_solutions", dest="all_solutions", action="store_true", default=False,
+                        help="Find all the solutions with backtracking search, and write each one to the " +
+                        "solution file as soon as it is found, followed by their number. Not available with " +
+                        "--portfolio, --cubes or --components.")
+    parser.add_argument("-C", "--count_solutions", dest="count_solutions", action="store_true", default=False,
+                        help="Count the solutions with backtracking search, without writing them. Not " +
+                        "available with --portfolio, --cubes or --components.")
+    parser.add_argument("--max_solutions", dest="max_solutions", type=int, default=None, metavar="N",
+                        help="Stop after N solutions with --all_solutions or --count_solutions.")
+    parser.add_argument("--portfolio", dest="portfolio", type=int, default=0, metavar="N",
+                        help="Run N backtracking searches in parallel processes: the configuration given by the " +
+                        "other options and N-1 others, and keep the first answer (default: %(default)s, no portfolio)")
+    parser.add_argument("--cubes", dest="cube_workers", type=int, default=0, metavar="N",
+                        help="Split the backtracking search into cubes, its first decisions, and search them in N " +
+                        "parallel processes (default: %(default)s, no cubes)")
+    parser.add_argument("--cube_depth", dest="cube_depth", type=int, default=10, metavar="DEPTH",
+                        help="The maximum number of times a cube is split (default: %(default)s)")
+    parser.add_argument("--components", dest="component_workers", type=int, default=0, metavar="N",
+                        help="Solve the connected components of the constraint graph separately, in N parallel " +
+                        "processes, or one after the other if N is 1 (default: %(default)s, all together)")
     parser.add_argument("-t", "--max_steps", dest="max_steps", type=int, default=10000,
                         metavar="MAX_STEPS", help="The maximum number of steps used for Local Search (default: %(default)s)")
+    parser.add_argument("-w", "--walk_prob", dest="walk_probability", type=float, default=0.02,
+                        metavar="WALK_PROB", help="The probability of a random walk move in Local Search (default: %(default)s)")
+    parser.add_argument("-T", "--tabu_tenure", dest="tabu_tenure", type=int, default=10,
+                        metavar="TABU", help="The number of steps a value stays tabu in Local Search (default: %(default)s)")
     parser.add_argument("-k", "--sudoku", dest="sudoku_output",
                         action="store_true", default=False,
                         help="Interpret the solution as Sudoku output and display it in the terminal.")
 
     args = parser.parse_args()
 
+    if args.restart_unit < 1:
+        parser.error("--restart_unit must be at least 1")
+
+    # The parallel searches run in other processes, which do not report
+    # everything the backtracking search of this process does
+    parallel = [option for option, n_workers in [("--portfolio", args.portfolio),
+                                                 ("--cubes", args.cube_workers),
+                                                 ("--components", args.component_workers)]
+                if n_workers > 0]
+    if parallel and args.stats:
+        parser.error("--stats cannot be used with " + parallel[0])
+    if args.search_algorithm != "backtracking" and args.stats:
+        parser.error("--stats cannot be used with -S " + args.search_algorithm)
+    if parallel and (args.max_nodes is not None or args.timeout is not None or args.max_rss is not None):
+        parser.error("--max-nodes, --timeout and --max-rss cannot be used with " + parallel[0])
+    if parallel and (args.all_solutions or args.count_solutions or args.max_solutions is not None):
+        parser.error("--all_solutions, --count_solutions and --max_solutions cannot be used with " + parallel[0])
+    if args.max_solutions is not None and not (args.all_solutions or args.count_solutions):
+        parser.error("--max_solutions requires --all_solutions or --count_solutions")
+    if args.max_solutions is not None and args.max_solutions < 1:
+        parser.error("--max_solutions must be at least 1")
+
     """
     print ("Command line options:")
     print ("    Input file:         ", args.input_file_name)
@@ -128,11 +214,21 @@ def main():
     variable_selection_function = get_variable_selection_function(
         args.variable_heuristic)
     value_ordering_function = get_value_ordering_function(args.value_heuristic)
-    inference_pre_function = get_inference_function(args.preprocessing)
-    inference_search_function = get_inference_function(args.search_inference)
+    if args.phase_saving:
+        value_ordering_function = phase_saving(value_ordering_function)
+    try:
+        if args.core == "bitset":
+            inference_pre_function = bitset_csp.get_inference_function(args.preprocessing)
+            inference_search_function = bitset_csp.get_inference_function(args.search_inference)
+        else:
+            inference_pre_function = get_inference_function(args.preprocessing)
+            inference_search_function = get_inference_function(args.search_inference)
+    except ImportError as e:
+        raise SystemExit(e)
 
     print("Parsing CSP file:", args.input_file_name)
-    csp = CSP()
+    native_alldiff = args.alldiff == "native"
+    csp = bitset_csp.BitsetCSP(native_alldiff) if args.core == "bitset" else CSP(native_alldiff)
     if not csp.parse_csp_file(args.input_file_name):
         return
     print("Success.")
@@ -173,33 +269,160 @@ def main():
             print("Error: cannot open output file:", args.output_file_name)
         return
 
+    if args.solution_file_name is None:
+        solution_file = sys.stdout
+    else:
+        try:
+            solution_file = open(args.solution_file_name, "w")
+        except IOError as e:
+            print("Error: could not open output file:", args.solution_file_name)
+            return
+
     search = None
-    if args.search_algorithm == "backtracking":
+    stats = None
+    limits = None
+
+    # The number of solutions, when they are enumerated or counted instead
+    # of stopping at the first one
+    n_solutions = None
+    if args.search_algorithm == "backtracking" and args.portfolio > 0:
+        import parallel_search
+        print("Search algorithm: Portfolio of", args.portfolio, "backtracking searches")
+        first = parallel_search.Configuration(args.variable_heuristic, args.value_heuristic,
+                                              args.search_inference, args.backjumping,
+                                              args.nogood_capacity, args.restart_strategy,
+                                              args.phase_saving)
+        try:
+            assignment, explored, search_time, winner = parallel_search.portfolio_search(
+                csp, initial_assignment, first, args.portfolio, args.rng_seed, args.restart_unit)
+        except ValueError as e:
+            raise SystemExit(e)
+        print("Portfolio winner:", parallel_search.describe(winner))
+
+    elif args.search_algorithm == "backtracking" and args.cube_workers > 0:
+        import parallel_search
+        print("Search algorithm: Cube-and-conquer with", args.cube_workers, "workers")
+        config = parallel_search.Configuration(args.variable_heuristic, args.value_heuristic,
+                                               args.search_inference, args.backjumping,
+                                               args.nogood_capacity, args.restart_strategy,
+                                               args.phase_saving)
+        try:
+            assignment, explored, search_time, n_cubes = parallel_search.cube_and_conquer(
+                csp, initial_assignment, config, args.cube_workers, args.rng_seed,
+                args.cube_depth, args.restart_unit)
+        except ValueError as e:
+            raise SystemExit(e)
+        print("Cubes:", n_cubes)
+
+    elif args.search_algorithm == "backtracking" and args.component_workers > 0:
+        import decomposition
+        import parallel_search
+        print("Search algorithm: Backtracking on each connected component, with",
+              args.component_workers, "workers")
+        config = parallel_search.Configuration(args.variable_heuristic, args.value_heuristic,
+                                               args.search_inference, args.backjumping,
+                                               args.nogood_capacity, args.restart_strategy,
+                                               args.phase_saving)
+        try:
+            assignment, explored, search_time, sizes = decomposition.solve_components(
+                csp, initial_assignment, config, args.component_workers, args.rng_seed,
+                args.restart_unit)
+        except ValueError as e:
+            raise SystemExit(e)
+        print("Components:", len(sizes), "largest:", max(sizes, default=0))
+
+    elif args.search_algorithm == "backtracking":
         import backtracking_search
         print("Search algorithm: Backtracking")
-        assignment, explored, search_time = backtracking_search.search(csp, initial_assignment,
-                                                                       variable_selection_function, value_ordering_function, inference_search_function)
+        nogoods = None
+        if args.nogood_capacity > 0:
+            from nogood_store import NogoodStore
+            nogoods = NogoodStore(args.nogood_capacity)
+            print("Nogood store capacity:", args.nogood_capacity)
+        if args.backjumping or nogoods is not None:
+            print("Backjumping: conflict-directed")
+        restarts = get_restart_schedule(args.restart_strategy, args.restart_unit)
+        if restarts is not None:
+            print("Restarts:", args.restart_strategy, "with unit", args.restart_unit)
+        if args.stats:
+            from search_stats import SearchStats
+            stats = SearchStats()
+        if args.max_nodes is not None or args.timeout is not None or args.max_rss is not None:
+            from search_limits import SearchLimits
+            try:
+                limits = SearchLimits(args.max_nodes, args.timeout, args.max_rss)
+            except (ValueError, ImportError) as e:
+                raise SystemExit(e)
+        if args.all_solutions or args.count_solutions:
+            def write_solution(solution):
+                solution_file.write("Solution: " + " ".join([var+"="+val
+                                                             for var, val in solution.items()]) + "\n")
+
+            n_solutions, explored, search_time = backtracking_search.count_solutions(
+                csp, initial_assignment, variable_selection_function, value_ordering_function,
+                inference_search_function, args.backjumping, args.search_inference in (None, "forward"),
+                nogoods, restarts, stats, limits, write_solution if args.all_solutions else None,
+                args.max_solutions)
+            print("Solutions:", n_solutions)
+        else:
+            assignment, explored, search_time = backtracking_search.search(csp, initial_assignment,
+                                                                           variable_selection_function, value_ordering_function, inference_search_function,
+                                                                           args.backjumping, args.search_inference in (None, "forward"), nogoods,
+                                                                           restarts, stats, limits)
+        if nogoods is not None:
+            print("Nogoods learned: {}, hits: {}, evictions: {}, stored: {}".format(
+                nogoods.learned, nogoods.hits, nogoods.evictions, len(nogoods)))
 
     elif args.search_algorithm == "local":
         import local_search
         print("Search algorithm: Local Search")
-        assignment, explored, search_time = local_search.search(csp, initial_assignment,
-                                                                variable_selection_function, value_ordering_function, args.max_steps)
+        try:
+            assignment, explored, search_time = local_search.search(csp, initial_assignment,
+                                                                    variable_selection_function, value_ordering_function, args.max_steps,
+                                                                    args.walk_probability, args.tabu_tenure)
+        except ValueError as e:
+            raise SystemExit(e)
+    elif args.search_algorithm == "structured":
+        import tree_search
+        print("Search algorithm: Tree solving with cycle-cutset conditioning")
+        try:
+            assignment, explored, search_time = tree_search.search(csp, initial_assignment)
+        except ValueError as e:
+            raise SystemExit(e)
     else:
         raise SystemExit(
             "[Fatal]: Search algorithm {} is not supported!".format(args.search_algorithm))
 
-    if args.solution_file_name is None:
-        solution_file = sys.stdout
-    else:
-        try:
-            solution_file = open(args.solution_file_name, "w")
-        except IOError as e:
-            print("Error: could not open output file:", args.solution_file_name)
-            return
-
     # Display the result
-    if assignment is None:
+    if n_solutions is not None:
+        # The solutions themselves have already been written. The count is
+        # only a lower bound if the search was stopped.
+        stopped = limits is not None and limits.reason is not None
+        if n_solutions > 0:
+            solution_file.write("SAT\n")
+        else:
+            solution_file.write("UNKNOWN\n" if stopped else "UNSAT\n")
+        solution_file.write("Solutions: " + str(n_solutions) + "\n")
+        solution_file.write("Explored: " + str(explored) + "\n")
+        solution_file.write("Time: " + str(search_time) + "\n")
+        if stopped:
+            solution_file.write("Stopped: " + limits.reason + "\n")
+    elif assignment is None and args.search_algorithm == "local":
+        # Local search is incomplete, so failing does not prove anything
+        print("No solution found.")
+        solution_file.write("UNKNOWN\n")
+        solution_file.write("Explored: " + str(explored) + "\n")
+        solution_file.write("Time: " + str(search_time) + "\n")
+    elif assignment is None and limits is not None and limits.reason is not None:
+        # The search gave up, so report how far it got
+        print("No solution found:", limits.reason)
+        solution_file.write("UNKNOWN\n")
+        solution_file.write("Explored: " + str(explored) + "\n")
+        solution_file.write("Time: " + str(search_time) + "\n")
+        solution_file.write("Stopped: " + limits.reason + "\n")
+        solution_file.write("Partial: " + " ".join([var+"="+val
+                                                    for var, val in limits.deepest.items()]) + "\n")
+    elif assignment is None:
         print("There is no solution!")
         solution_file.write("UNSAT\n")
         solution_file.write("Explored: " + str(explored) + "\n")
@@ -222,6 +445,9 @@ def main():
             solution_file.write("Solution: " + " ".join([var+"="+val
                                                          for var, val in assignment.items()]) + "\n")
 
+    if stats is not None:
+        solution_file.write("Stats: " + stats.to_json() + "\n")
+
 
 if __name__ == "__main__":
     main()
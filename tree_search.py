@@ -0,0 +1,226 @@
+# COMP3620/6320 Artificial Intelligence
+# The Australian National University
+# Authors: COMP-3620 team
+# Date:    2021
+
+""" This file implements a solver for tree-structured CSPs and cycle-cutset
+    conditioning for the others.
+
+    When the constraint graph is a forest, the CSP can be solved without any
+    backtracking in O(n d^2). Each tree is ordered from a root so that every
+    variable comes after its parent. Making the parent of each variable arc
+    consistent with it, from the last variable to the first (directional arc
+    consistency), leaves every value of a parent with a support in each of
+    its children. The variables can then be assigned in order, each one to a
+    value compatible with its parent, and the assignment never fails. If
+    directional arc consistency empties a domain, there is no solution.
+
+    Otherwise, a cycle cutset is a set of variables whose removal leaves a
+    forest. Cycle-cutset conditioning searches over the assignments of the
+    cutset only, with forward checking, and solves the rest of the CSP as a
+    forest for each one, in O(d^c n d^2) for a cutset of c variables. The
+    cutset is chosen greedily, so it is small for CSPs that are nearly trees,
+    and its variables are conditioned on in a dynamic smallest domain first
+    order.
+"""
+
+import time
+
+
+def forest_order(csp, variables):
+    """ Order the given variables so that each one comes after its parent in
+        a spanning forest of the constraint graph between them, trees in the
+        order of `csp.variables`. Return the order and the parent of each
+        variable (None for the roots), or None if the graph has a cycle.
+        (CSP, set([str])) -> ([str], {str : str}) or None
+    """
+    order = []
+    parent = {}
+    for root in csp.variables:
+        if root not in variables or root in parent:
+            continue
+        parent[root] = None
+        order.append(root)
+        head = len(order) - 1
+        while head < len(order):
+            var = order[head]
+            head += 1
+            for ovar in csp.neighbours[var]:
+                if ovar not in variables or ovar == parent[var]:
+                    continue
+                if ovar in parent:
+                    return None
+                parent[ovar] = var
+                order.append(ovar)
+    return order, parent
+
+
+def cycle_cutset(csp):
+    """ Return a set of variables whose removal leaves the constraint graph
+        a forest. The variables of degree at most one are removed from the
+        graph until none is left, since they are not on a cycle, and then the
+        variable of highest degree goes into the cutset, until the graph is
+        empty.
+        (CSP) -> [str]
+    """
+    graph = dict([(var, set(csp.neighbours[var])) for var in csp.variables])
+    cutset = []
+
+    def remove(var):
+        for ovar in graph.pop(var):
+            graph[ovar].discard(var)
+
+    while graph:
+        leaves = [var for var in graph if len(graph[var]) <= 1]
+        while leaves:
+            var = leaves.pop()
+            if var not in graph:
+                continue
+            others = graph[var]
+            remove(var)
+            leaves.extend([ovar for ovar in others if len(graph[ovar]) <= 1])
+        if graph:
+            var = max(csp.variables, key=lambda x: len(graph[x]) if x in graph else -1)
+            cutset.append(var)
+            remove(var)
+    return cutset
+
+
+def solve_forest(csp, order, parent, domains):
+    """ Solve the CSP restricted to the variables of the forest given by
+        order and parent (see forest_order) with the given domains, by
+        directional arc consistency. The domains are not changed.
+        Return the assignment of the variables, or None if there is none.
+        (CSP, [str], {str : str}, {str : set([str])}) -> {str : str}
+    """
+    domains = dict([(var, set(domains[var])) for var in order])
+    conflicts = csp.conflicts
+    for var in reversed(order):
+        domain = domains[var]
+        if not domain:
+            return None
+        pvar = parent[var]
+        if pvar is None:
+            continue
+        # Keep the values of the parent with a support in the domain of var
+        supported = set()
+        for pval in domains[pvar]:
+            pconf = conflicts[(pvar, pval)].get(var, ())
+            if any(val not in pconf for val in domain):
+                supported.add(pval)
+        domains[pvar] = supported
+
+    assignment = {}
+    for var in order:
+        pvar = parent[var]
+        pconf = () if pvar is None else conflicts[(pvar, assignment[pvar])].get(var, ())
+        for val in csp.domains[var]:
+            if val in domains[var] and val not in pconf:
+                assignment[var] = val
+                break
+    return assignment
+
+
+def search(csp, initial_assignment):
+    """ Solve the CSP by cycle-cutset conditioning, which is tree solving
+        alone if the constraint graph is a forest.
+
+        The variables of the initial assignment are kept fixed. The values
+        are taken from the current domains, so preprocessing prunes the
+        search space.
+
+        Return the assignment found as a solution, the number of nodes
+        expanded and the search time. The nodes are the values tried for the
+        cutset variables, and one per variable of the forest when it is
+        solved. If there is no solution, None will be returned in place of
+        the solution.
+
+        (CSP, {str : str}) -> ({str : str}, int, float)
+    """
+    if csp.alldiffs:
+        raise ValueError("Error: the structured search does not support native alldiff "
+                         "constraints, use '-a binary'")
+
+    start_time = time.time()
+    domains = dict([(var, set(csp.current_domains[var])) for var in csp.variables])
+    for var, val in initial_assignment.items():
+        domains[var] &= set([val])
+
+    cutset = cycle_cutset(csp)
+    in_cutset = set(cutset)
+    order, parent = forest_order(csp, set([var for var in csp.variables if var not in in_cutset]))
+    print("Cycle cutset:", len(cutset), "of", len(csp.variables), "variables")
+
+    def condition(var, val):
+        """ Restrict the domain of var to val and forward check it. Return the
+            list of (var, values removed), or None with nothing changed if a
+            domain is wiped out.
+        """
+        pruned = [(var, domains[var] - set([val]))]
+        domains[var] = set([val])
+        for ovar, ovals in csp.conflicts[(var, val)].items():
+            removed = domains[ovar] & ovals
+            if removed:
+                domains[ovar] -= removed
+                pruned.append((ovar, removed))
+                if not domains[ovar]:
+                    undo(pruned)
+                    return None
+        return pruned
+
+    def undo(pruned):
+        """Restore the values removed by condition()."""
+        for ovar, removed in pruned:
+            domains[ovar] |= removed
+
+    # The stack contains a list of [var, values, val_pos, pruned] for each
+    # cutset variable conditioned on. The next one is the cutset variable
+    # with the fewest values left, as with the MRV heuristic.
+    stack = []
+    remaining = list(cutset)
+    n_expanded_nodes = 0
+    assignment = None
+    while True:
+        if not remaining:
+            assignment = solve_forest(csp, order, parent, domains)
+            if assignment is not None:
+                n_expanded_nodes += len(order)
+                for var in cutset:
+                    assignment[var] = next(iter(domains[var]))
+                break
+        else:
+            var = min(remaining, key=lambda x: len(domains[x]))
+            remaining.remove(var)
+            stack.append([var, [val for val in csp.domains[var] if val in domains[var]], 0, None])
+
+        # Move on to the next value that survives forward checking,
+        # backtracking when a cutset variable runs out of values
+        while stack:
+            entry = stack[-1]
+            var, values, pos, pruned = entry
+            if pruned is not None:
+                undo(pruned)
+                entry[3] = None
+            if pos >= len(values):
+                stack.pop()
+                remaining.append(var)
+                continue
+            entry[2] += 1
+            n_expanded_nodes += 1
+            entry[3] = condition(var, values[pos])
+            if entry[3] is not None:
+                break
+        if not stack:
+            break
+
+    soln_time = time.time() - start_time
+    if assignment is None:
+        print("No solution!")
+        print("Nodes expanded:", n_expanded_nodes)
+        print("Time:", soln_time)
+        return None, n_expanded_nodes, soln_time
+
+    print("Solved problem!")
+    print("Nodes expanded:", n_expanded_nodes)
+    print("Time:", soln_time)
+    return assignment, n_expanded_nodes, soln_time
@@ -15,8 +15,12 @@ import argparse
 import os
 import sys
 import itertools
+import math
+import contextlib
 from functools import reduce
-from reference_n_to_bin import convert
+from model_counting import ModelCounter
+from n_to_bin import binarise, to_csp
+from parallel_search import Configuration, apply_cube, configuration_inference, run_configuration, undo_cube
 
 class Wumpus_world:
     """this is the map of the Wumpus world and each cell in the map is represented as a cell_state
@@ -106,6 +110,21 @@ class Wumpus_world:
         for n_x, n_y in neighbours:
             self.Map[n_y][n_x].update_possible_state("W")
     
+    def observe(self, x, y, percepts):
+        """update the KB with the percepts observed in the (x,y) cell and reason the possible states of the adjacent cells
+        """
+        self.observed_cells.add((x, y))
+        if len(percepts) == 0: # perceive nothing. it is safe
+            self.spread_safe(x, y) 
+        else:
+            for pc in percepts:
+                if pc == "Breeze":
+                    self.spread_pit(x, y)
+                    self.cons_cells.add((x, y))
+                elif pc == "Stench":
+                    self.spread_wumpus(x, y)
+                    self.cons_cells.add((x, y))
+
     def get_risky_cells(self, perc_cells: set, observed_cells):
         """return all the cells where it may have pits or wumpus in it
             Returns:
@@ -199,9 +218,15 @@ def process_command_line_arguments() -> argparse.Namespace:
                         help="Action to be tested for safety (MANDATORY)")
     parser.add_argument("-o", "--output", dest="output", metavar="OUTPUT", default='wumpus_outputs',
                         help="Output folder (default: %(default)s)")
+    parser.add_argument("-p", "--probability", dest="probability", action="store_true",
+                        help="Print the exact probability of a pit and of a Wumpus in the cell ahead instead of writing the CSP files")
+    parser.add_argument("-v", "--verdicts", dest="verdicts", action="store_true",
+                        help="Solve the CSPs in memory and print the verdict of all four actions instead of writing the CSP files")
+    parser.add_argument("-n", "--incremental", dest="incremental", action="store_true",
+                        help="Apply the observations one at a time to the same knowledge base and print the verdicts after each one")
 
     args = parser.parse_args()
-    if args.action is None:
+    if args.action is None and not args.verdicts and not args.incremental:
         raise SystemExit("Error: No action was specified.")
 
     if args.input is None:
@@ -219,90 +244,109 @@ def process_command_line_arguments() -> argparse.Namespace:
 
     return args
 
+def place_values(n_adj, amounts):
+    """generate every tuple of n_adj values with the given number of positions of each value and "S" in the others. the positions
+    of each value are chosen with itertools.combinations among the ones still free, so each tuple is built exactly once
+
+        Args:
+            n_adj (int): the length of the tuples
+            amounts (list): list of (value, number of positions) e.g. [("P", 2), ("W", 1)]
+
+        Returns:
+            set: set of tuples of values
+    """
+    tuples = [["S"] * n_adj]
+    for value, amount in amounts:
+        next_tuples = []
+        for tup in tuples:
+            free = [i for i, v in enumerate(tup) if v == "S"]
+            for positions in itertools.combinations(free, amount):
+                new_tup = list(tup)
+                for i in positions:
+                    new_tup[i] = value
+                next_tuples.append(new_tup)
+        tuples = next_tuples
+    return set([tuple(tup) for tup in tuples])
+
 def generate_constraint_domain(domain, n_adj):
-    """using the permutations of the provided domain to generate the constraint domain such as constraint of there is at less one pit in the adjacent cells of the cell that feels breeze
+    """generate the constraint domain such as constraint of there is at less one pit in the adjacent cells of the cell that feels breeze,
+    i.e. all the tuples with at least one of each value of the domain and "S" in the other positions
 
         Args:
             domain (list): the list of value e.g. ["S","P"]
             n_adj (int): the number of variable involved in this constraint
 
         Raises:
-            SystemExit: we don't need to use the permutations to generate the uanry constraint
+            SystemExit: one cell cannot have both a pit and a Wumpus
 
         Returns:
             set: constraint domain
     """
     result = set()
     if len(domain) == 1:
-        result = set(itertools.permutations([domain[0] for _ in range(n_adj)] + ['S' for _ in range(n_adj - 1)], n_adj))
+        for amount in range(1, n_adj + 1):
+            result |= place_values(n_adj, [(domain[0], amount)])
     else:
         if n_adj == 1:
             raise SystemExit("Error: n_adj == 1 for [B,S].")
-        if n_adj == 2:
-            result = set(itertools.permutations(['W', 'P'], 2))
-        elif n_adj == 3:
-            result = set(itertools.permutations(['W','W', 'P', 'P'], 3)).union(set(itertools.permutations(['W', 'P', 'S'], 3)))
-        else:
-            result = set(itertools.permutations(['W','W','W', 'P', 'P','P'], 4)).union(set(itertools.permutations(['W','P','S','S'], 4)),
-                                                                                       set(itertools.permutations(['W','P','P','S'], 4)),
-                                                                                       set(itertools.permutations(['W','W','P','S'], 4)))
+        for n_p in range(1, n_adj):
+            for n_w in range(1, n_adj - n_p + 1):
+                result |= place_values(n_adj, [("P", n_p), ("W", n_w)])
     return result
 
-def generate_amount_domain(domain, n_adj, n_p, n_w):
-    """To generate the amount constraint domain e.g. there are at most n_p pits and n_w wumpus in this n_adj cells
+def generate_amount_domain(domain, n_adj, n_p, n_w, n_others):
+    """To generate the amount constraint domain e.g. there are at most n_p pits and n_w wumpus in this n_adj cells, and the
+    pits and wumpus left fit in the n_others unknown cells outside of them, so that the whole map has exactly n_p pits and n_w
+    wumpus
     """
-    return set(itertools.permutations(["P" for _ in range(n_p)] + ['W' for _ in range(n_w)] + ['S' for _ in range(n_adj)], n_adj))
+    result = set()
+    for n_pits in range(min(n_p, n_adj) + 1):
+        for n_wumpuses in range(min(n_w, n_adj - n_pits) + 1):
+            if (n_p - n_pits) + (n_w - n_wumpuses) <= n_others:
+                result |= place_values(n_adj, [("P", n_pits), ("W", n_wumpuses)])
+    return result
 
-def main():
-#--------------------------------------------- Section 0: definition ---------------------------------------------
-    # Processes the arguments passed through the command line
-    args = process_command_line_arguments()
+def count_other_cells(W_WORLD, risky_cells):
+    """return the number of cells which may have a pit or a Wumpus but are in no constraint, i.e. the cells not observed, not
+    known to be safe and not in risky_cells
+    """
+    risky_cells = set(risky_cells)
+    return len([(x, y) for y in range(W_WORLD.Y_max) for x in range(W_WORLD.X_max)
+                if (x, y) not in W_WORLD.observed_cells and (x, y) not in risky_cells and W_WORLD.get_cell_state(x, y) != "S"])
 
-    # The name of the action to test
-    action = args.action
+def build_model(dao, action):
+    """build the Wumpus world from the observations and the n-ary model of the cells around the ones where something was perceived
 
-    # The path of the directory that will contain the generated CSP files
-    output_path = args.output
+        Args:
+            dao (dict): the description of the Wumpus World and the sequence of observations, as in the input file
+            action (str): the action to be tested for safety
 
-    # The description of the Wumpus World features and sequence of observations
-    # resulting from the agent actions.
-    dao          = args.domain_and_observations
+        Returns:
+            tuple: None if the action is an invalid move, else (world, test position, risky cells, cell domains, cell constraints)
+                   where the constraints are the ones of the percepts only, without the amount constraint
+    """
+#--------------------------------------------- Section 0: definition ---------------------------------------------
     n_rows       = dao["rows"]         # y
     n_columns    = dao["columns"]      # x
     n_wumpuses   = dao["wumpuses"]
     n_pits       = dao["pits"]
     observations = dao["observations"] # [ {"location" : [x,y], "percepts" : ["Breeze"]} ... ]
 
-    # definition
-    input_file              = args.input.split("/")[-1].split(".")[0]                   # the scenario 
-    
     W_WORLD                 = Wumpus_world(n_columns, n_rows, n_wumpuses, n_pits)       # Wumpus_world instance
     cur_pos                 = observations[-1]["location"]                              # note that this is the scenario coordinate
     is_next_valid, test_pos = W_WORLD.is_in_map(action, cur_pos[0] - 1, cur_pos[1] - 1) # test_pos is the next position 
-    observed_cells          = set()                                                     # set of all the cell which have observation
-    observed_cons_cells     = set()                                                     # set of all the cell which perceive danger
+    observed_cells          = W_WORLD.observed_cells                                    # set of all the cell which have observation
+    observed_cons_cells     = W_WORLD.cons_cells                                        # set of all the cell which perceive danger
 
 #--------------------------------------------- Section 1: update the map ---------------------------------------------
     # if the next move is invalid than just quit
     if not is_next_valid:
-        print("invalid move")
         return None
 
     # for all the observed cells update the KB and reason the possible states of the adjacent cells
     for ob in observations:
         obs_x, obs_y = tuple(ob["location"]) # note that this is the scenario coordinate 
-        ob_percepts  = ob["percepts"]
-        observed_cells.add((obs_x - 1, obs_y - 1))
-        if len(ob_percepts) == 0: # perceive nothing. it is safe
-            W_WORLD.spread_safe(obs_x - 1, obs_y - 1) 
-        else:
-            for pc in ob_percepts:
-                if pc == "Breeze":
-                    W_WORLD.spread_pit(obs_x - 1, obs_y - 1)
-                    observed_cons_cells.add((obs_x - 1, obs_y - 1))
-                elif pc == "Stench":
-                    W_WORLD.spread_wumpus(obs_x - 1, obs_y - 1)
-                    observed_cons_cells.add((obs_x - 1, obs_y - 1))
+        W_WORLD.observe(obs_x - 1, obs_y - 1, ob["percepts"])
 
 #--------------------------------------------- Section 2: doamin part -------------------------------------------------
     # this section will generate the state domain of the risky variables
@@ -323,11 +367,43 @@ def main():
         adj_risky_cells = W_WORLD.adjacent_risky_cells(xp, yp, observed_cells)
         cons_domain = generate_constraint_domain(list(W_WORLD.get_cell_percepts(xp, yp)), len(adj_risky_cells))
         cell_constraints.append((tuple(adj_risky_cells), cons_domain))
+
+    return W_WORLD, test_pos, risky_cells, cell_domains, cell_constraints
+
+def cell_name(pos):
+    """return the name of the variable of the cell at pos e.g. (0, 1) -> "0_1". the separator keeps the names of cells
+    such as (1, 10) and (11, 0) apart on maps with 10 or more rows or columns
+    """
+    return "{}_{}".format(pos[0], pos[1])
+
+def amount_constraint(W_WORLD, risky_cells, amount_domains=None):
+    """return the amount constraint of the pits and wumpus over the risky cells, see generate_amount_domain
+
+        Args:
+            amount_domains (dict): if given, the amount constraint domains already generated for this world by number of risky
+                                   cells and of other unknown cells, which is updated
+    """
+    if amount_domains is None:
+        amount_domains = {}
+    key = (len(risky_cells), count_other_cells(W_WORLD, risky_cells))
+    if key not in amount_domains:
+        amount_domains[key] = generate_amount_domain(["P", "W", "S"], key[0], W_WORLD.num_pits, W_WORLD.num_wumpuses, key[1])
+    return (tuple(risky_cells), amount_domains[key])
+
+def variant_constraints(W_WORLD, test_pos, risky_cells, cell_constraints, amount_domains=None):
+    """add the amount constraint to the constraints of the percepts and make the two variants of the model
+
+        Args:
+            amount_domains (dict): if given, the amount constraint domains already generated for this world by number of risky
+                                   cells and of other unknown cells, which is updated
+
+        Returns:
+            tuple: (constraints of the a model where the next position is not safe, constraints of the b model where it is safe)
+    """
     # this the amount constraints of the pits and wumpus
-    amount_domain = generate_amount_domain(["P", "W", "S"], len(risky_cells),W_WORLD.num_pits, W_WORLD.num_wumpuses)
-    cell_constraints.append((risky_cells, amount_domain))
+    constraints = cell_constraints + [amount_constraint(W_WORLD, risky_cells, amount_domains)]
 
-    # this section will generate a special constsaint for ...a.csp which is the next position is not safe
+    # this will generate a special constsaint for the a model which is the next position is not safe
     if W_WORLD.num_wumpuses == 0:
         a_constraint = ((test_pos,), {"P"})
         
@@ -335,17 +411,336 @@ def main():
         a_constraint = ((test_pos,), {"W"})
     else:
         a_constraint = ((test_pos,), {"P", "W"})
-        
-    cell_constraints.append(a_constraint)
+
+    # and the b model where the next position is safe
+    return constraints + [a_constraint], constraints + [((test_pos,), {"S"})]
+
+# the domain of the cells in the binarised constraints of the knowledge base, which is narrowed when the CSP is put together
+CELL_DOMAIN = {"P", "W", "S"}
+
+def binarise_constraint(constraint):
+    """binarise a single constraint over cells, see n_to_bin.binarise. the cells have the full domain, so the result only
+    depends on the constraint
+
+        Returns:
+            tuple: None if the constraint cannot be satisfied, else (binary variables, binary constraints)
+    """
+    scope = tuple([cell_name(pos) for pos in constraint[0]])
+    return binarise(dict([(name, CELL_DOMAIN) for name in scope]), [(scope, list(constraint[1]))])
+
+class WumpusAgentKB:
+    """the knowledge base of an agent moving in the Wumpus world, which is kept alive between observations. a new observation
+    only updates the constraints of the cell observed and of the cells around it that perceive danger, instead of building the
+    map and every constraint again.
+
+    the derived CSP is kept alive too. each constraint of a cell which perceives danger is binarised once, when the cell is
+    observed or its scope changes, and the amount constraint once per observation. a CSP cannot lose variables or constraints,
+    so the CSP is put together again from these binarised parts after an observation changes something, and it is shared by
+    the verdicts until the next one. the two models of a verdict are decisions on the next position, which are undone after the
+    search, like the cubes of parallel_search. the verdicts are a warm start for the next ones: a cell proven safe or unsafe
+    keeps this domain, since observations only add constraints, and the values of the last solution found are tried first
+    (phase saving)
+    """
+    def __init__(self, c, r, num_w, num_p, config=None):
+        """init function
+
+            Args:
+                c (int): the number of columns in the map
+                r (int): the number of rows in the map
+                num_w (int): the number of Wumpus in the map
+                num_p (int): the number of pit in the map
+                config (parallel_search.Configuration): the configuration of the search, MRV with forward checking and phase
+                                                        saving by default
+        """
+        if config is None:
+            config = Configuration("mrv", "lex", "forward", phase_saving=True)
+        self.W_WORLD        = Wumpus_world(c, r, num_w, num_p)
+        self.config         = config
+        self.position       = None # the current position of the agent
+        self.constraints    = {}   # constraint of each cell which perceives danger e.g. { (x,y) : ((adjacent risky cells), domain) }
+        self.binary_parts   = {}   # the binarised constraint of each cell which perceives danger, None if it cannot be satisfied
+        self.risky_cells    = {}   # the number of constraints each risky cell is in, in the order they became risky
+        self.known_domains  = {}   # the domains of the cells proven safe or unsafe by the previous solves
+        self.phases         = {}   # the last value assigned to each variable by the searches
+        self.cons_domains   = {}   # the constraint domains already generated by (percepts, n_adj)
+        self.amount_domains = {}   # the amount constraint domains already generated by numbers of risky and other cells
+        self.csp            = None # the derived CSP, None if no map agrees with the observations
+        self.csp_is_current = True # whether the derived CSP includes the last observation
+
+    @classmethod
+    def from_observations(cls, dao, config=None):
+        """make the knowledge base of the Wumpus World described by dao and apply all of its observations
+        """
+        kb = cls(dao["columns"], dao["rows"], dao["wumpuses"], dao["pits"], config)
+        for ob in dao["observations"]:
+            kb.observe(ob["location"], ob["percepts"])
+        return kb
+
+    def observe(self, location, percepts):
+        """move the agent to location (in the scenario coordinate) and apply what it perceives there
+
+            Args:
+                location (list): the [x, y] position of the observation
+                percepts (list): what was perceived e.g. ["Breeze", "Stench"]
+        """
+        x, y = location[0] - 1, location[1] - 1
+        self.position = (x, y)
+        if (x, y) in self.W_WORLD.observed_cells:
+            # the percepts of a cell never change
+            return
+        self.W_WORLD.observe(x, y, percepts)
+        self.known_domains.pop((x, y), None)
+        self.csp_is_current = False
+
+        # only the constraint of this cell and the ones of the adjacent cells, whose scope contained this cell, change
+        for cell in [(x, y)] + self.W_WORLD.adjacent_cells(x, y):
+            if cell in self.W_WORLD.cons_cells:
+                self.update_constraint(cell)
+
+    def update_constraint(self, cell):
+        """generate and binarise again the constraint of a cell which perceives danger, over its adjacent cells not observed yet
+        """
+        if cell in self.constraints:
+            for risky_cell in self.constraints[cell][0]:
+                self.risky_cells[risky_cell] -= 1
+                if self.risky_cells[risky_cell] == 0:
+                    del self.risky_cells[risky_cell]
+        adj_risky_cells = tuple(self.W_WORLD.adjacent_risky_cells(cell[0], cell[1], self.W_WORLD.observed_cells))
+        percepts = tuple(sorted(self.W_WORLD.get_cell_percepts(cell[0], cell[1])))
+        if (percepts, len(adj_risky_cells)) not in self.cons_domains:
+            self.cons_domains[(percepts, len(adj_risky_cells))] = generate_constraint_domain(list(percepts), len(adj_risky_cells))
+        self.constraints[cell] = (adj_risky_cells, self.cons_domains[(percepts, len(adj_risky_cells))])
+        self.binary_parts[cell] = binarise_constraint(self.constraints[cell])
+        for risky_cell in adj_risky_cells:
+            self.risky_cells[risky_cell] = self.risky_cells.get(risky_cell, 0) + 1
+
+    def derived_csp(self):
+        """return the binary CSP of the risky cells, putting it together again if an observation changed something since the
+        last time
+
+            Returns:
+                CSP: None if no map agrees with the observations
+        """
+        if self.csp_is_current:
+            return self.csp
+        self.csp_is_current = True
+        self.csp = None
+        parts = list(self.binary_parts.values())
+        parts.append(binarise_constraint(amount_constraint(self.W_WORLD, list(self.risky_cells), self.amount_domains)))
+        if None in parts:
+            return None
+
+        # the domains of the cells, narrowed by the previous solves, and of the union variables are the intersections of the
+        # ones of every part, and so are the constraints between the same variables
+        domains = {}
+        for xr, yr in self.risky_cells:
+            domains[cell_name((xr, yr))] = self.W_WORLD.get_cell_possible_states(xr, yr) | {"S"}
+            if (xr, yr) in self.known_domains:
+                domains[cell_name((xr, yr))] &= self.known_domains[(xr, yr)]
+        constraints = {}
+        for part_variables, part_constraints in parts:
+            for var, domain in part_variables.items():
+                domains[var] = domains[var] & domain if var in domains else set(domain)
+            for (var0, var1), valid_list in part_constraints:
+                if (var1, var0) in constraints:
+                    var0, var1, valid_list = var1, var0, [(y, x) for x, y in valid_list]
+                constraints[(var0, var1)] = constraints.get((var0, var1), set(valid_list)) & set(valid_list)
+
+        # a value of a union variable is only kept if the values it gives to the cells are still in their domains
+        for (var0, var1), valid_set in constraints.items():
+            domains[var1] &= set([y for x, y in valid_set if x in domains[var0]])
+            domains[var0] &= set([x for x, y in valid_set if y in domains[var1]])
+        if not all(domains.values()):
+            return None
+        self.csp = to_csp(domains, [(var_pair, list(valid_set)) for var_pair, valid_set in constraints.items()])
+        self.csp.phases = self.phases # shared, so that the phases are kept when the CSP is put together again
+        return self.csp
+
+    def is_satisfiable(self, var=None, val=None):
+        """decide whether the derived CSP has a solution where var (the name of a cell) has the value val, or any solution if
+        var is None. the decision is undone afterwards
+        """
+        csp = self.csp
+        _, inference = configuration_inference(csp, self.config)
+        assignment = {}
+        cube = [] if var is None else [(var, val)]
+        if not apply_cube(csp, assignment, cube, inference):
+            return False
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            solution, _, _ = run_configuration(csp, assignment, self.config)
+        undo_cube(csp, assignment, cube)
+        return solution is not None
+
+    def verdict(self, action):
+        """decide whether the action is safe from the current position, see safety_verdicts
+
+            Raises:
+                SystemExit: no map agrees with the observations
+
+            Returns:
+                str: "invalid", "trivial", "safe", "unsafe" or "unknown"
+        """
+        is_next_valid, test_pos = self.W_WORLD.is_in_map(action, self.position[0], self.position[1])
+        if not is_next_valid:
+            return "invalid"
+        if test_pos in self.W_WORLD.observed_cells:
+            return "trivial"
+        csp = self.derived_csp()
+        if csp is None:
+            raise SystemExit("Error: no map agrees with the observations.")
+        test_var = cell_name(test_pos)
+        if test_var not in csp.domains:
+            # the next position is not risky, so it is a trivial safe position
+            maybe_unsafe = False
+            maybe_safe   = self.is_satisfiable()
+        else:
+            domain       = csp.current_domains[test_var]
+            maybe_unsafe = any(self.is_satisfiable(test_var, val) for val in sorted(domain - {"S"}))
+            maybe_safe   = "S" in domain and self.is_satisfiable(test_var, "S")
+        if maybe_unsafe and maybe_safe:
+            return "unknown"
+        elif maybe_unsafe:
+            self.prove(test_pos, set(["P", "W"]))
+            return "unsafe"
+        elif maybe_safe:
+            self.prove(test_pos, {"S"})
+            return "safe"
+        raise SystemExit("Error: no map agrees with the observations.")
+
+    def prove(self, cell, states):
+        """record that the states of the cell are among the given ones, and remove the others from its domain in the derived CSP
+        """
+        self.known_domains[cell] = self.known_domains.get(cell, CELL_DOMAIN) & states
+        var = cell_name(cell)
+        if var in self.csp.domains:
+            self.csp.notify_of_inference(None, {}, [(var, val) for val in self.csp.current_domains[var] - states])
+
+    def verdicts(self):
+        """return the verdict of each of the four actions from the current position
+        """
+        return dict([(action, self.verdict(action)) for action in ["north", "east", "south", "west"]])
+
+def safety_verdicts(dao, config=None):
+    """decide whether each of the four actions is safe, in a single call and without any file. the verdict of an action is
+    "invalid" if it leaves the map, "trivial" if it leads to an observed cell, "unsafe" if the a model (the next position is not
+    safe) is the only satisfiable one, "safe" if the b model (the next position is safe) is the only one and "unknown" if both are
+
+        Args:
+            dao (dict): the description of the Wumpus World and the sequence of observations, as in the input file
+            config (parallel_search.Configuration): the configuration of the search, see WumpusAgentKB
+
+        Raises:
+            SystemExit: no map agrees with the observations
+
+        Returns:
+            dict: the verdict of each action e.g. {"north": "safe", "east": "unknown", ...}
+    """
+    return WumpusAgentKB.from_observations(dao, config).verdicts()
+
+def risk_probabilities(dao, action):
+    """compute the exact probability that the cell the action leads to has a pit or a Wumpus, given the observations. Every map
+    with the given number of pits and Wumpuses, at most one per cell and none in the observed cells, that agrees with the
+    percepts is equally likely.
+
+    The maps are counted with a #CSP counter over the risky cells only (model_counting.ModelCounter), tallied by their number of
+    pits and Wumpuses, so that the amount constraint does not tie all the risky cells together. The remaining pits and Wumpuses
+    can go anywhere in the other unknown cells, which multiplies the count of each tally by a number of combinations.
+
+        Args:
+            dao (dict): the description of the Wumpus World and the sequence of observations, as in the input file
+            action (str): the action to be tested for safety
+
+        Raises:
+            SystemExit: no map agrees with the observations
+
+        Returns:
+            tuple: None if the action is an invalid move, else (probability of a pit, probability of a Wumpus, the counter)
+    """
+    model = build_model(dao, action)
+    if model is None:
+        return None
+    W_WORLD, test_pos, risky_cells, cell_domains, cell_constraints = model
+    n_pits, n_wumpuses = W_WORLD.num_pits, W_WORLD.num_wumpuses
+
+    # the unknown cells which are not risky, they are not in any constraint
+    n_others = count_other_cells(W_WORLD, cell_domains)
+    counter = ModelCounter(("P", "W"), (n_pits, n_wumpuses))
+
+    def n_maps(domains):
+        """the number of maps where the risky cells take values in the given domains"""
+        tally = counter.count(domains, cell_constraints)
+        return sum([n * math.comb(n_others, n_pits - p) * math.comb(n_others - (n_pits - p), n_wumpuses - w)
+                    for (p, w), n in tally.items() if (n_pits - p) + (n_wumpuses - w) <= n_others])
+
+    total = n_maps(cell_domains)
+    if total == 0:
+        raise SystemExit("Error: no map agrees with the observations.")
+    probabilities = []
+    for value in ["P", "W"]:
+        domains = dict(cell_domains)
+        domains[test_pos] = cell_domains[test_pos] & {value}
+        probabilities.append(n_maps(domains) / total)
+    return probabilities[0], probabilities[1], counter
+
+def main():
+    # Processes the arguments passed through the command line
+    args = process_command_line_arguments()
+
+    # The name of the action to test
+    action = args.action
+
+    # The path of the directory that will contain the generated CSP files
+    output_path = args.output
+
+    # The description of the Wumpus World features and sequence of observations
+    # resulting from the agent actions.
+    dao = args.domain_and_observations
+
+    # definition
+    input_file = args.input.split("/")[-1].split(".")[0] # the scenario 
+
+    if args.incremental:
+        kb = WumpusAgentKB(dao["columns"], dao["rows"], dao["wumpuses"], dao["pits"])
+        for ob in dao["observations"]:
+            kb.observe(ob["location"], ob["percepts"])
+            print(ob["location"], " ".join([action + ": " + verdict for action, verdict in kb.verdicts().items()]))
+        return None
+
+    if args.verdicts:
+        for action, verdict in safety_verdicts(dao).items():
+            print(action + ":", verdict)
+        return None
+
+    if args.probability:
+        result = risk_probabilities(dao, action)
+        if result is None:
+            print("invalid move")
+            return None
+        p_pit, p_wumpus, counter = result
+        print("P(pit):", p_pit)
+        print("P(wumpus):", p_wumpus)
+        print("Components counted:", counter.misses, "cached:", counter.hits)
+        return None
+
+    model = build_model(dao, action)
+    if model is None:
+        print("invalid move")
+        return None
+    W_WORLD, test_pos, risky_cells, cell_domains, cell_constraints = model
+
+    a_constraints, b_constraints = variant_constraints(W_WORLD, test_pos, risky_cells, cell_constraints)
 
 #--------------------------------------------- Section 4: file part ---------------------------------------------------
+    # the reference binariser is only needed to write the files
+    from reference_n_to_bin import convert
+
     # this seaction will write the a.csp file
     with open(output_path + "/" + input_file + "_" + action + "_a.csp", "w") as file:
         for pos, domain in cell_domains.items():
-            file.write("var " + "".join([str(p) for p in pos]) + " : " +  " ".join(domain) + "\n")
+            file.write("var " + cell_name(pos) + " : " +  " ".join(domain) + "\n")
             
-        for cons_vars_tuple, cons_valid_set in cell_constraints:
-            cons_vars = ["".join([str(x) for x in p]) for p in cons_vars_tuple]
+        for cons_vars_tuple, cons_valid_set in a_constraints:
+            cons_vars = [cell_name(p) for p in cons_vars_tuple]
             cons_valid_list = list(cons_valid_set)
             cons_valid_list[0] = " ".join(cons_valid_list[0])
             if len(cons_valid_list) == 1:
@@ -354,15 +749,12 @@ def main():
                 file.write("con " + " ".join(cons_vars) + " : " + reduce(lambda x, y: x + " : " + " ".join(y), cons_valid_list) + "\n")
 
     # this seaction will write the b.csp file
-    # this will generate a special constsaint for ...b.csp which is the next position is safe
-    cell_constraints.remove(a_constraint)
-    cell_constraints.append(((test_pos,), {"S"}))
     with open(output_path + "/" + input_file + "_" + action + "_b.csp", "w") as file:
         for pos, domain in cell_domains.items():
-            file.write("var " + "".join([str(p) for p in pos]) + " : " +  " ".join(domain) + "\n")
+            file.write("var " + cell_name(pos) + " : " +  " ".join(domain) + "\n")
             
-        for cons_vars_tuple, cons_valid_set in cell_constraints:
-            cons_vars = ["".join([str(x) for x in p]) for p in cons_vars_tuple]
+        for cons_vars_tuple, cons_valid_set in b_constraints:
+            cons_vars = [cell_name(p) for p in cons_vars_tuple]
             cons_valid_list = list(cons_valid_set)
             cons_valid_list[0] = " ".join(cons_valid_list[0])
             if len(cons_valid_list) == 1: